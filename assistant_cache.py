@@ -0,0 +1,49 @@
+"""
+On-disk cache of the LangGraph assistant ID.
+
+Remembering the assistant between processes saves the /assistants/search
+round-trip every server start would otherwise pay before its first run. The
+cache is best-effort: a missing, unreadable or unwritable file just means the
+assistant is looked up again.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+# Configuration
+ASSISTANT_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser() / "deep-research" / "assistant.json"
+)
+
+
+def load_assistant_id(graph_id: str) -> Optional[str]:
+    """Return the cached assistant ID if it was saved for this graph."""
+    try:
+        data = json.loads(ASSISTANT_CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get("graph_id") != graph_id:
+        return None
+    return data.get("assistant_id")
+
+
+def save_assistant_id(assistant_id: str, graph_id: str) -> None:
+    """Cache the assistant ID, replacing the file atomically so readers never see a partial write."""
+    try:
+        ASSISTANT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=ASSISTANT_CACHE_PATH.parent, suffix=".tmp", delete=False) as f:
+            json.dump({"assistant_id": assistant_id, "graph_id": graph_id}, f)
+        os.replace(f.name, ASSISTANT_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def clear_assistant_id() -> None:
+    """Forget the cached assistant, e.g. after the server rejected it."""
+    try:
+        ASSISTANT_CACHE_PATH.unlink()
+    except OSError:
+        pass
@@ -1,119 +1,156 @@
 from mcp.server.fastmcp import FastMCP
-from dotenv import load_dotenv
-import requests
 import asyncio
+import hashlib
 import time
 from typing import Dict, Optional
-import uuid
+import secrets
 
-load_dotenv()
+from research_core import (
+    POLL_BASE_DELAY,
+    backoff_sleep,
+    clarification_request,
+    client,
+    coalesce,
+    create_thread,
+    fetch_final_report,
+    get_assistant,
+    join_run_stream,
+    make_lifespan,
+    semantic_cache,
+    server_ok,
+)
+from session_store import Session, SessionStore
 
-mcp = FastMCP("Deep Research Async")
+# This server's sessions, persisted to SQLite (iteration order == start order)
+active_sessions = SessionStore("async")
 
-# Configuration
-LANGGRAPH_API_URL = "http://localhost:2024"
-HEADERS = {"Authorization": "Bearer dev-token"}
+mcp = FastMCP("Deep Research Async", lifespan=make_lifespan(active_sessions))
 
-# Session storage - in production, use Redis or database
-active_sessions: Dict[str, Dict] = {}
-assistant_id: Optional[str] = None
+def format_report(final_report: str) -> str:
+    """Wrap a final report in the markers clients use to present it verbatim."""
+    return f"""RESEARCH_REPORT_START
 
-def get_assistant():
-    """Get or create assistant - cached globally."""
-    global assistant_id
-    if assistant_id:
-        return assistant_id
+{final_report}
+
+RESEARCH_REPORT_END
+
+[This is the complete research report. Present it to the user exactly as shown above between the RESEARCH_REPORT_START and RESEARCH_REPORT_END markers, without adding commentary, summary, or modifications.]"""
+
+async def get_progress(session_id: str) -> Dict:
+    """
+    Check a session's run status.
+    
+    Returns:
+        Dict with "state" - one of "running", "done", "error", "missing" or
+        "unknown" - plus the LangGraph run "status", "elapsed" seconds while
+        running, and "error" text if the status request itself failed
+    """
+    session = active_sessions.get(session_id)
+    if session is None:
+        return {"state": "missing"}
     
     try:
-        # Try to find existing assistant
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=HEADERS)
-        if response.status_code == 200:
-            assistants = response.json()
-            if assistants:
-                assistant_id = assistants[0]["assistant_id"]
-                return assistant_id
-        
-        # Create new one
-        payload = {"graph_id": "Deep Researcher", "name": "Research Assistant"}
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=HEADERS)
-        if response.status_code in [200, 201]:
-            assistant_id = response.json()["assistant_id"]
-            return assistant_id
-    except:
-        pass
-    return None
+        response = await client.get(f"/threads/{session.thread_id}/runs/{session.run_id}")
+    except Exception as e:
+        return {"state": "unknown", "error": str(e)}
+    if response.status_code != 200:
+        return {"state": "unknown"}
+    
+    status = response.json().get("status")
+    if status == "success":
+        session.status = "completed"
+        active_sessions[session_id] = session
+        return {"state": "done", "status": status}
+    if status in ["error", "timeout", "interrupted"]:
+        session.status = "error"
+        active_sessions[session_id] = session
+        return {"state": "error", "status": status}
+    if status in ["pending", "running"]:
+        return {"state": "running", "status": status, "elapsed": int(time.monotonic() - session.started_at)}
+    return {"state": "unknown", "status": status}
 
-def create_thread():
-    """Create a new thread."""
-    try:
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=HEADERS)
-        if response.status_code in [200, 201]:
-            return response.json()["thread_id"]
-    except:
-        pass
-    return None
+def format_progress(session_id: str, progress: Dict) -> str:
+    """Render a get_progress() result as a tool message."""
+    state = progress["state"]
+    if state == "missing":
+        return f"❌ Session {session_id} not found. Use start_research() to begin."
+    if state == "done":
+        return f"✅ Research completed for session {session_id}!\n\nUse `get_research_results('{session_id}')` to retrieve the report."
+    if state == "error":
+        return f"❌ Research failed for session {session_id} with status: {progress['status']}"
+    if state == "running":
+        return f"🔍 Research in progress for session {session_id}\n\nElapsed time: {progress['elapsed']} seconds\nStatus: {progress['status']}"
+    if "error" in progress:
+        return f"❌ Error checking progress: {progress['error']}"
+    return f"❓ Could not get status for session {session_id}"
 
-async def poll_for_completion(thread_id: str, run_id: str, max_wait: int = 720) -> Dict:
-    """Async polling for research completion."""
-    start_time = time.time()
+async def wait_for_results(session_id: str, timeout: int = 720) -> Optional[str]:
+    """
+    Wait for a session's run to finish and return its results, or None if it is still running after timeout.
     
-    while time.time() - start_time < max_wait:
+    Follows the run's event stream, so completion is noticed as soon as the
+    server reports it; only failed status checks are retried with backoff.
+    """
+    deadline = time.monotonic() + timeout
+    delay = POLL_BASE_DELAY
+    while True:
+        session = active_sessions.get(session_id)
+        if session is None:
+            return format_progress(session_id, {"state": "missing"})
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
         try:
-            response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{run_id}", 
-                                  headers=HEADERS)
-            if response.status_code == 200:
-                run_data = response.json()
-                status = run_data.get("status")
-                
-                if status == "success":
-                    # Get the final state
-                    state_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/state", 
-                                                headers=HEADERS)
-                    if state_response.status_code == 200:
-                        return {"status": "success", "data": state_response.json()}
-                
-                elif status in ["error", "timeout", "interrupted"]:
-                    return {"status": "error", "message": f"Research failed with status: {status}"}
-            
-            # Non-blocking sleep
-            await asyncio.sleep(2)
-            
-        except Exception as e:
-            return {"status": "error", "message": f"Polling error: {str(e)}"}
-    
-    return {"status": "timeout", "message": "Research timed out"}
+            await asyncio.wait_for(join_run_stream(session.thread_id, session.run_id), timeout=remaining)
+        except asyncio.TimeoutError:
+            return None
+        
+        progress = await get_progress(session_id)
+        if progress["state"] == "done":
+            return await get_research_results(session_id)
+        elif progress["state"] in ["error", "missing"]:
+            return format_progress(session_id, progress)
+        
+        # The status check failed, or the stream ended before the run did - back off and rejoin
+        delay = await backoff_sleep(delay)
 
 @mcp.tool()
-def start_research(question: str, allow_clarification: bool = True) -> str:
+async def start_research(question: str, allow_clarification: bool = True, allow_cache: bool = True) -> str:
     """
     Start a research session. Returns immediately with a session ID.
     Use check_research_progress() to monitor and get_research_results() to retrieve results.
+    If a near-identical question was answered recently, the cached report is returned instead.
     
     Args:
         question: The research question or topic to investigate
         allow_clarification: Whether to allow the system to ask clarifying questions
+        allow_cache: Whether a cached report for a similar question may be returned
     
     Returns:
-        Session ID for tracking the research
+        Session ID for tracking the research, or the cached report
     """
+    if allow_cache:
+        cached_report = await asyncio.to_thread(semantic_cache.lookup, question)
+        if cached_report:
+            return format_report(cached_report)
+    
     # Check server
-    try:
-        requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
-    except:
+    if not await server_ok():
         return "❌ Deep Research server not available at http://localhost:2024"
     
     # Get assistant
-    assistant = get_assistant()
+    assistant = await get_assistant()
     if not assistant:
         return "❌ Could not get research assistant"
     
     # Create thread
-    thread_id = create_thread()
+    thread_id = await create_thread()
     if not thread_id:
         return "❌ Could not create research thread"
     
     # Generate session ID
-    session_id = str(uuid.uuid4())[:8]
+    session_id = secrets.token_hex(4)
     
     try:
         # Start research
@@ -126,8 +163,7 @@ def start_research(question: str, allow_clarification: bool = True) -> str:
                 }
             }
         }
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs", 
-                               json=payload, headers=HEADERS)
+        response = await client.post(f"/threads/{thread_id}/runs", json=payload)
         
         if response.status_code != 200:
             return f"❌ Failed to start research: {response.text}"
@@ -135,13 +171,13 @@ def start_research(question: str, allow_clarification: bool = True) -> str:
         run_id = response.json()["run_id"]
         
         # Store session info
-        active_sessions[session_id] = {
-            "thread_id": thread_id,
-            "run_id": run_id,
-            "question": question,
-            "status": "running",
-            "started_at": time.time()
-        }
+        active_sessions[session_id] = Session(
+            thread_id=thread_id,
+            run_id=run_id,
+            question=question,
+            status="running",
+            started_at=time.monotonic(),
+        )
         
         return f"✅ Research started! Session ID: **{session_id}**\n\nUse `check_research_progress('{session_id}')` to monitor progress."
         
@@ -149,7 +185,7 @@ def start_research(question: str, allow_clarification: bool = True) -> str:
         return f"❌ Research error: {str(e)}"
 
 @mcp.tool()
-def check_research_progress(session_id: str) -> str:
+async def check_research_progress(session_id: str) -> str:
     """
     Check the progress of a research session.
     
@@ -159,39 +195,10 @@ def check_research_progress(session_id: str) -> str:
     Returns:
         Current status and progress information
     """
-    if session_id not in active_sessions:
-        return f"❌ Session {session_id} not found. Use start_research() to begin."
-    
-    session = active_sessions[session_id]
-    thread_id = session["thread_id"]
-    run_id = session["run_id"]
-    
-    try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{run_id}", 
-                              headers=HEADERS)
-        if response.status_code == 200:
-            run_data = response.json()
-            status = run_data.get("status")
-            
-            if status == "success":
-                session["status"] = "completed"
-                return f"✅ Research completed for session {session_id}!\n\nUse `get_research_results('{session_id}')` to retrieve the report."
-            
-            elif status in ["error", "timeout", "interrupted"]:
-                session["status"] = "error"
-                return f"❌ Research failed for session {session_id} with status: {status}"
-            
-            elif status in ["pending", "running"]:
-                elapsed = int(time.time() - session["started_at"])
-                return f"🔍 Research in progress for session {session_id}\n\nElapsed time: {elapsed} seconds\nStatus: {status}"
-        
-        return f"❓ Could not get status for session {session_id}"
-        
-    except Exception as e:
-        return f"❌ Error checking progress: {str(e)}"
+    return format_progress(session_id, await get_progress(session_id))
 
 @mcp.tool()
-def get_research_results(session_id: str) -> str:
+async def get_research_results(session_id: str) -> str:
     """
     Get the results of a completed research session.
     
@@ -205,61 +212,50 @@ def get_research_results(session_id: str) -> str:
         return f"❌ Session {session_id} not found."
     
     session = active_sessions[session_id]
-    thread_id = session["thread_id"]
-    question = session["question"]
+    thread_id = session.thread_id
+    question = session.question
     
     try:
-        # Check if research is complete
-        response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{session['run_id']}", 
-                              headers=HEADERS)
+        # The report alone answers the common "ready" path - stream it out of the state
+        final_report = await fetch_final_report(thread_id)
+        if final_report:
+            # Remember the report for similar questions, then clean up the session
+            await asyncio.to_thread(semantic_cache.store, question, final_report)
+            del active_sessions[session_id]
+            return format_report(final_report)
+        
+        # No report - the full state is needed to look for a clarification request
+        state_response = await client.get(f"/threads/{thread_id}/state")
+        if state_response.status_code != 200:
+            return f"❌ Could not retrieve results for session {session_id}"
+        
+        state = state_response.json()
+        values = state.get("values", {})
+        # Nodes still scheduled to run means the run hasn't finished yet
+        finished = not state.get("next")
+        # Right after continue_research the state is still the previous run's checkpoint, old question included
+        this_run = (state.get("metadata") or {}).get("run_id") == session.run_id
+        
+        if finished and this_run:
+            # Check for clarification request
+            question = clarification_request(values)
+            if question:
+                return f"🤔 **Clarification Needed for Session {session_id}**\n\n{question}\n\nUse `continue_research('{session_id}', 'your answer')` to provide clarification."
+        
+        # No report or question yet - fall back to the run status
+        response = await client.get(f"/threads/{thread_id}/runs/{session.run_id}")
         if response.status_code == 200:
             run_data = response.json()
             if run_data.get("status") != "success":
                 return f"❌ Research not yet complete for session {session_id}. Current status: {run_data.get('status')}"
         
-        # Get the final state
-        state_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/state", 
-                                    headers=HEADERS)
-        if state_response.status_code == 200:
-            state = state_response.json()
-            values = state.get("values", {})
-            
-            # Check for final report
-            final_report = values.get("final_report")
-            if final_report:
-                # Clean up session
-                del active_sessions[session_id]
-                return f"""RESEARCH_REPORT_START
-
-{final_report}
-
-RESEARCH_REPORT_END
-
-[This is the complete research report. Present it to the user exactly as shown above between the RESEARCH_REPORT_START and RESEARCH_REPORT_END markers, without adding commentary, summary, or modifications.]"""
-            
-            # Check for clarification request
-            messages = values.get("messages", [])
-            if messages:
-                last_message = messages[-1]
-                if hasattr(last_message, 'content'):
-                    content = last_message.content
-                elif isinstance(last_message, dict):
-                    content = last_message.get('content', '')
-                else:
-                    content = str(last_message)
-                
-                if content and ('?' in content or 'clarify' in content.lower() or 'specify' in content.lower()):
-                    return f"🤔 **Clarification Needed for Session {session_id}**\n\n{content}\n\nUse `continue_research('{session_id}', 'your answer')` to provide clarification."
-            
-            return f"❌ No results found for session {session_id}"
-        
-        return f"❌ Could not retrieve results for session {session_id}"
+        return f"❌ No results found for session {session_id}"
         
     except Exception as e:
         return f"❌ Error getting results: {str(e)}"
 
 @mcp.tool()
-def continue_research(session_id: str, clarification_answer: str) -> str:
+async def continue_research(session_id: str, clarification_answer: str) -> str:
     """
     Continue research after providing clarification.
     
@@ -274,10 +270,10 @@ def continue_research(session_id: str, clarification_answer: str) -> str:
         return f"❌ Session {session_id} not found."
     
     session = active_sessions[session_id]
-    thread_id = session["thread_id"]
+    thread_id = session.thread_id
     
     try:
-        assistant = get_assistant()
+        assistant = await get_assistant()
         if not assistant:
             return "❌ Could not get research assistant"
         
@@ -286,8 +282,7 @@ def continue_research(session_id: str, clarification_answer: str) -> str:
             "assistant_id": assistant,
             "input": {"messages": [{"role": "user", "content": clarification_answer}]}
         }
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs", 
-                               json=payload, headers=HEADERS)
+        response = await client.post(f"/threads/{thread_id}/runs", json=payload)
         
         if response.status_code != 200:
             return f"❌ Failed to continue research: {response.text}"
@@ -295,9 +290,11 @@ def continue_research(session_id: str, clarification_answer: str) -> str:
         run_id = response.json()["run_id"]
         
         # Update session
-        session["run_id"] = run_id
-        session["status"] = "running"
-        session["started_at"] = time.time()
+        session.run_id = run_id
+        session.status = "running"
+        session.started_at = time.monotonic()
+        # Re-insert so active_sessions stays ordered by started_at
+        active_sessions[session_id] = active_sessions.pop(session_id)
         
         return f"✅ Research continued for session {session_id}!\n\nUse `check_research_progress('{session_id}')` to monitor progress."
         
@@ -305,7 +302,7 @@ def continue_research(session_id: str, clarification_answer: str) -> str:
         return f"❌ Error continuing research: {str(e)}"
 
 @mcp.tool()
-def list_active_sessions() -> str:
+async def list_active_sessions() -> str:
     """
     List all active research sessions.
     
@@ -315,16 +312,38 @@ def list_active_sessions() -> str:
     if not active_sessions:
         return "No active research sessions."
     
-    result = "📋 **Active Research Sessions:**\n\n"
+    parts = ["📋 **Active Research Sessions:**\n\n"]
     for session_id, session in active_sessions.items():
-        elapsed = int(time.time() - session["started_at"])
-        result += f"• **{session_id}** - {session['status']} ({elapsed}s ago)\n"
-        result += f"  Question: {session['question'][:60]}...\n\n"
+        elapsed = int(time.monotonic() - session.started_at)
+        parts.append(
+            f"• **{session_id}** - {session.status} ({elapsed}s ago)\n"
+            f"  Question: {session.question[:60]}...\n\n"
+        )
     
-    return result
+    return "".join(parts)
+
+async def _research_question(question: str, allow_clarification: bool = True, allow_cache: bool = True) -> str:
+    """Run research_question without request coalescing."""
+    # Start research
+    start_result = await start_research(question, allow_clarification, allow_cache)
+    if "❌" in start_result or start_result.startswith("RESEARCH_REPORT_START"):
+        return start_result
+    
+    # Extract session ID
+    try:
+        session_id = start_result.split("Session ID: **")[1].split("**")[0]
+    except:
+        return "❌ Could not extract session ID from start result"
+    
+    # Wait for completion (with shorter timeout for sync behavior)
+    result = await wait_for_results(session_id, timeout=720)
+    if result is not None:
+        return result
+    
+    return f"⏰ Research is taking longer than expected. Session {session_id} may still be running. Use check_research_progress('{session_id}') to monitor."
 
 @mcp.tool()
-def research_question(question: str, allow_clarification: bool = True) -> str:
+async def research_question(question: str, allow_clarification: bool = True, allow_cache: bool = True) -> str:
     """
     Research a question using the Deep Researcher. This is the main research tool.
     This version is backward compatible but uses async sessions internally.
@@ -332,39 +351,17 @@ def research_question(question: str, allow_clarification: bool = True) -> str:
     Args:
         question: The research question or topic to investigate
         allow_clarification: Whether to allow the system to ask clarifying questions
+        allow_cache: Whether a cached report for a similar question may be returned
     
     Returns:
         The research results, clarifying question, or status
     """
-    # Start research
-    start_result = start_research(question, allow_clarification)
-    if "❌" in start_result:
-        return start_result
-    
-    # Extract session ID
-    try:
-        session_id = start_result.split("Session ID: **")[1].split("**")[0]
-    except:
-        return "❌ Could not extract session ID from start result"
-    
-    # Poll for completion (with shorter timeout for sync behavior)
-    start_time = time.time()
-    timeout = 720  # 2 minutes
-    
-    while time.time() - start_time < timeout:
-        progress = check_research_progress(session_id)
-        
-        if "✅ Research completed" in progress:
-            return get_research_results(session_id)
-        elif "❌" in progress:
-            return progress
-        
-        time.sleep(2)
-    
-    return f"⏰ Research is taking longer than expected. Session {session_id} may still be running. Use check_research_progress('{session_id}') to monitor."
+    # Identical concurrent questions share one research run
+    key = hashlib.sha256(f"{question}|{allow_clarification}|{allow_cache}".encode()).hexdigest()
+    return await coalesce("async", key, lambda: _research_question(question, allow_clarification, allow_cache))
 
 @mcp.tool()
-def research_question_sync(question: str, allow_clarification: bool = True, timeout: int = 720) -> str:
+async def research_question_sync(question: str, allow_clarification: bool = True, timeout: int = 720) -> str:
     """
     Research a question synchronously (blocks until complete). 
     Use this for simple cases where you want to wait for results.
@@ -377,10 +374,10 @@ def research_question_sync(question: str, allow_clarification: bool = True, time
     Returns:
         The research results or clarification request
     """
-    return research_question(question, allow_clarification)
+    return await research_question(question, allow_clarification)
 
 @mcp.tool()
-def continue_research_with_clarification(clarification_answer: str) -> str:
+async def continue_research_with_clarification(clarification_answer: str) -> str:
     """
     Continue research after providing clarification to a previous question.
     This is backward compatible - it finds the most recent session needing clarification.
@@ -395,32 +392,23 @@ def continue_research_with_clarification(clarification_answer: str) -> str:
     if not active_sessions:
         return "❌ No active research sessions found. Please start a new research session."
     
-    # Get the most recent session (simple heuristic)
-    latest_session_id = max(active_sessions.keys(), key=lambda x: active_sessions[x]["started_at"])
+    # Get the most recent session (simple heuristic) - sessions are kept in start order
+    latest_session_id = next(reversed(active_sessions))
     
     # Continue research with that session
-    continue_result = continue_research(latest_session_id, clarification_answer)
+    continue_result = await continue_research(latest_session_id, clarification_answer)
     if "❌" in continue_result:
         return continue_result
     
     # Wait for completion (like the sync version)
-    start_time = time.time()
-    timeout = 720
-    
-    while time.time() - start_time < timeout:
-        progress = check_research_progress(latest_session_id)
-        
-        if "✅ Research completed" in progress:
-            return get_research_results(latest_session_id)
-        elif "❌" in progress:
-            return progress
-        
-        time.sleep(2)
+    result = await wait_for_results(latest_session_id, timeout=720)
+    if result is not None:
+        return result
     
     return f"⏰ Research is taking longer than expected. Session {latest_session_id} may still be running."
 
 @mcp.tool()
-def get_current_thread_info() -> str:
+async def get_current_thread_info() -> str:
     """
     Get information about current research threads.
     Shows all active sessions for backward compatibility.
@@ -428,13 +416,13 @@ def get_current_thread_info() -> str:
     Returns:
         Thread information or status
     """
-    return list_active_sessions()
+    return await list_active_sessions()
 
 @mcp.tool()
-def check_research_status() -> str:
+async def check_research_status() -> str:
     """Check if the Deep Research server is running."""
     try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+        response = await client.get("/docs", timeout=5)
         if response.status_code == 200:
             return "✅ Deep Research server is running and ready"
         else:
@@ -1,62 +1,44 @@
 from mcp.server.fastmcp import FastMCP
-from dotenv import load_dotenv
-import requests
 import asyncio
+import hashlib
 import time
-from typing import Dict, Optional
-import uuid
+from typing import Optional
+import secrets
 
-load_dotenv()
+from research_core import (
+    clarification_request,
+    client,
+    coalesce,
+    create_thread,
+    fetch_final_report,
+    get_assistant,
+    join_run_stream,
+    make_lifespan,
+    semantic_cache,
+    server_ok,
+)
+from session_store import Session, SessionStore
 
-mcp = FastMCP("Deep Research")
+# This server's sessions, persisted to SQLite (iteration order == start order)
+active_sessions = SessionStore("final")
 
-# Configuration
-LANGGRAPH_API_URL = "http://localhost:2024"
-HEADERS = {"Authorization": "Bearer dev-token"}
+mcp = FastMCP("Deep Research", lifespan=make_lifespan(active_sessions))
 
-# Session storage for recovery - in production, use Redis or database
-active_sessions: Dict[str, Dict] = {}
-assistant_id: Optional[str] = None
+def format_report(final_report: str) -> str:
+    """Wrap a final report with instructions to present it verbatim."""
+    return f"""RESEARCH_REPORT_COMPLETE
 
-def get_assistant():
-    """Get or create assistant - cached globally."""
-    global assistant_id
-    if assistant_id:
-        return assistant_id
-    
-    try:
-        # Try to find existing assistant
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=HEADERS)
-        if response.status_code == 200:
-            assistants = response.json()
-            if assistants:
-                assistant_id = assistants[0]["assistant_id"]
-                return assistant_id
-        
-        # Create new one
-        payload = {"graph_id": "Deep Researcher", "name": "Research Assistant"}
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=HEADERS)
-        if response.status_code in [200, 201]:
-            assistant_id = response.json()["assistant_id"]
-            return assistant_id
-    except:
-        pass
-    return None
+{final_report}
 
-def create_thread():
-    """Create a new thread."""
-    try:
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=HEADERS)
-        if response.status_code in [200, 201]:
-            return response.json()["thread_id"]
-    except:
-        pass
-    return None
+[INSTRUCTION: Present the above research report to the user exactly as written, without summarizing, modifying, or adding commentary. This is the complete, final research report.]"""
 
 async def wait_for_research_completion(thread_id: str, run_id: str, session_id: str, timeout: int = 720) -> str:
     """
     Async wait for research completion. Non-blocking for other users.
     
+    Subscribes to the run's event stream instead of polling, so completion is
+    noticed as soon as the server reports it.
+    
     Args:
         thread_id: The LangGraph thread ID
         run_id: The LangGraph run ID  
@@ -66,104 +48,66 @@ async def wait_for_research_completion(thread_id: str, run_id: str, session_id:
     Returns:
         Final research report or error message
     """
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        try:
-            # Check run status
-            response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{run_id}", 
-                                  headers=HEADERS)
-            
-            if response.status_code == 200:
-                run_data = response.json()
-                status = run_data.get("status")
-                
-                if status == "success":
-                    # Get the final state
-                    state_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/state", 
-                                                headers=HEADERS)
-                    if state_response.status_code == 200:
-                        state = state_response.json()
-                        values = state.get("values", {})
-                        
-                        # Check for final report
-                        final_report = values.get("final_report")
-                        if final_report:
-                            # Clean up session
-                            if session_id in active_sessions:
-                                del active_sessions[session_id]
-                            # Return the complete report with clear instructions
-                            return f"""RESEARCH_REPORT_COMPLETE
-
-{final_report}
-
-[INSTRUCTION: Present the above research report to the user exactly as written, without summarizing, modifying, or adding commentary. This is the complete, final research report.]"""
-                        
-                        # Check for clarification request
-                        messages = values.get("messages", [])
-                        if messages:
-                            last_message = messages[-1]
-                            if hasattr(last_message, 'content'):
-                                content = last_message.content
-                            elif isinstance(last_message, dict):
-                                content = last_message.get('content', '')
-                            else:
-                                content = str(last_message)
-                            
-                            if content and ('?' in content or 'clarify' in content.lower() or 'specify' in content.lower()):
-                                return f"🤔 **Clarification Needed**\n\n{content}\n\n**Thread ID:** {thread_id}\n\n*Use `continue_research_with_clarification()` to provide your answer.*"
-                        
-                        return f"❌ Research completed but no results found. Thread ID: {thread_id}"
-                
-                elif status in ["error", "timeout", "interrupted"]:
-                    return f"❌ Research failed with status: {status}. Thread ID: {thread_id} (you can try to recover results later)"
-            
-            # Non-blocking sleep - allows other requests to process
-            await asyncio.sleep(2)
-            
-        except Exception as e:
-            return f"❌ Error during research: {str(e)}. Thread ID: {thread_id}"
-    
-    # Timeout - but preserve session for recovery
-    return f"⏰ Research timed out after {timeout} seconds. Thread ID: {thread_id}\n\nThe research may still be running. Use `get_research_by_thread_id('{thread_id}')` to check for results later."
+    try:
+        error = await asyncio.wait_for(join_run_stream(thread_id, run_id), timeout=timeout)
+        if error:
+            return f"❌ Research failed: {error}. Thread ID: {thread_id} (you can try to recover results later)"
+        
+        # Check for final report - streamed out of the state without parsing all of it
+        final_report = await fetch_final_report(thread_id)
+        if final_report:
+            # Remember the report for similar questions, then clean up the session
+            session = active_sessions.get(session_id)
+            if session:
+                await asyncio.to_thread(semantic_cache.store, session.question, final_report)
+                active_sessions.pop(session_id, None)
+            # Return the complete report with clear instructions
+            return format_report(final_report)
+        
+        # No report - the full state is needed to look for a clarification request
+        state_response = await client.get(f"/threads/{thread_id}/state")
+        if state_response.status_code != 200:
+            return f"❌ Could not fetch research results. Thread ID: {thread_id} (you can try to recover results later)"
+        
+        values = state_response.json().get("values", {})
+        
+        # Check for clarification request
+        question = clarification_request(values)
+        if question:
+            return f"🤔 **Clarification Needed**\n\n{question}\n\n**Thread ID:** {thread_id}\n\n*Use `continue_research_with_clarification()` to provide your answer.*"
+        
+        return f"❌ Research completed but no results found. Thread ID: {thread_id}"
+        
+    except asyncio.TimeoutError:
+        # Timeout - but preserve session for recovery
+        return f"⏰ Research timed out after {timeout} seconds. Thread ID: {thread_id}\n\nThe research may still be running. Use `get_research_by_thread_id('{thread_id}')` to check for results later."
+    except Exception as e:
+        return f"❌ Error during research: {str(e)}. Thread ID: {thread_id}"
 
-@mcp.tool()
-async def research_question(question: str, allow_clarification: bool = True, timeout: int = 720) -> str:
-    """
-    Research a question using the Deep Researcher. This is the main research entry point.
+async def _research_question(question: str, allow_clarification: bool = True, timeout: int = 720, allow_cache: bool = True) -> str:
+    """Run research_question without request coalescing."""
+    # Answer near-duplicate questions from the semantic cache
+    if allow_cache:
+        cached_report = await asyncio.to_thread(semantic_cache.lookup, question)
+        if cached_report:
+            return format_report(cached_report)
     
-    This function will:
-    1. Start the research process
-    2. Wait for completion (non-blocking for other users)
-    3. Return the final report or clarification request
-    4. Provide thread ID for recovery if timeout/error occurs
-    
-    Args:
-        question: The research question or topic to investigate
-        allow_clarification: Whether to allow the system to ask clarifying questions
-        timeout: Maximum time to wait for completion in seconds (default: 12 minutes)
-    
-    Returns:
-        The final research report, clarification request, or error with recovery info
-    """
     # Check server availability
-    try:
-        requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
-    except:
+    if not await server_ok():
         return "❌ Deep Research server not available at http://localhost:2024"
     
     # Get assistant
-    assistant = get_assistant()
+    assistant = await get_assistant()
     if not assistant:
         return "❌ Could not get research assistant"
     
     # Create thread
-    thread_id = create_thread()
+    thread_id = await create_thread()
     if not thread_id:
         return "❌ Could not create research thread"
     
     # Generate session ID for tracking
-    session_id = str(uuid.uuid4())[:8]
+    session_id = secrets.token_hex(4)
     
     try:
         # Start research
@@ -176,8 +120,7 @@ async def research_question(question: str, allow_clarification: bool = True, tim
                 }
             }
         }
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs", 
-                               json=payload, headers=HEADERS)
+        response = await client.post(f"/threads/{thread_id}/runs", json=payload)
         
         if response.status_code != 200:
             return f"❌ Failed to start research: {response.text}"
@@ -185,12 +128,13 @@ async def research_question(question: str, allow_clarification: bool = True, tim
         run_id = response.json()["run_id"]
         
         # Store session for recovery
-        active_sessions[session_id] = {
-            "thread_id": thread_id,
-            "run_id": run_id,
-            "question": question,
-            "started_at": time.time()
-        }
+        active_sessions[session_id] = Session(
+            thread_id=thread_id,
+            run_id=run_id,
+            question=question,
+            status="running",
+            started_at=time.monotonic(),
+        )
         
         # Wait for completion (async, non-blocking for other users)
         result = await wait_for_research_completion(thread_id, run_id, session_id, timeout)
@@ -200,7 +144,31 @@ async def research_question(question: str, allow_clarification: bool = True, tim
         return f"❌ Research error: {str(e)}. Thread ID: {thread_id}"
 
 @mcp.tool()
-def continue_research_with_clarification(clarification_answer: str, thread_id: Optional[str] = None) -> str:
+async def research_question(question: str, allow_clarification: bool = True, timeout: int = 720, allow_cache: bool = True) -> str:
+    """
+    Research a question using the Deep Researcher. This is the main research entry point.
+    
+    This function will:
+    1. Start the research process
+    2. Wait for completion (non-blocking for other users)
+    3. Return the final report or clarification request
+    4. Provide thread ID for recovery if timeout/error occurs
+    
+    Args:
+        question: The research question or topic to investigate
+        allow_clarification: Whether to allow the system to ask clarifying questions
+        timeout: Maximum time to wait for completion in seconds (default: 12 minutes)
+        allow_cache: Whether a cached report for a similar question may be returned
+    
+    Returns:
+        The final research report, clarification request, or error with recovery info
+    """
+    # Identical concurrent questions share one research run
+    key = hashlib.sha256(f"{question}|{allow_clarification}|{timeout}|{allow_cache}".encode()).hexdigest()
+    return await coalesce("final", key, lambda: _research_question(question, allow_clarification, timeout, allow_cache))
+
+@mcp.tool()
+async def continue_research_with_clarification(clarification_answer: str, thread_id: Optional[str] = None) -> str:
     """
     Continue research after providing clarification to a previous question.
     
@@ -217,11 +185,12 @@ def continue_research_with_clarification(clarification_answer: str, thread_id: O
         # Find the most recent session
         if not active_sessions:
             return "❌ No active research sessions found and no thread_id provided."
-        latest_session = max(active_sessions.values(), key=lambda x: x["started_at"])
-        target_thread_id = latest_session["thread_id"]
+        # Sessions are inserted in start order, so the last one is the latest
+        latest_session = active_sessions[next(reversed(active_sessions))]
+        target_thread_id = latest_session.thread_id
     
     try:
-        assistant = get_assistant()
+        assistant = await get_assistant()
         if not assistant:
             return "❌ Could not get research assistant"
         
@@ -230,8 +199,7 @@ def continue_research_with_clarification(clarification_answer: str, thread_id: O
             "assistant_id": assistant,
             "input": {"messages": [{"role": "user", "content": clarification_answer}]}
         }
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads/{target_thread_id}/runs", 
-                               json=payload, headers=HEADERS)
+        response = await client.post(f"/threads/{target_thread_id}/runs", json=payload)
         
         if response.status_code != 200:
             return f"❌ Failed to continue research: {response.text}"
@@ -244,7 +212,7 @@ def continue_research_with_clarification(clarification_answer: str, thread_id: O
         return f"❌ Error continuing research: {str(e)}"
 
 @mcp.tool()
-def get_research_by_thread_id(thread_id: str) -> str:
+async def get_research_by_thread_id(thread_id: str) -> str:
     """
     Get research results by thread ID. Useful for recovering results after timeout or error.
     
@@ -255,37 +223,23 @@ def get_research_by_thread_id(thread_id: str) -> str:
         The research results if available, or current status
     """
     try:
-        # Get the thread state
-        state_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/state", 
-                                    headers=HEADERS)
+        # Check for final report - streamed out of the state without parsing all of it
+        final_report = await fetch_final_report(thread_id)
+        if final_report:
+            return format_report(final_report)
+        
+        # Get the full thread state
+        state_response = await client.get(f"/threads/{thread_id}/state")
         if state_response.status_code != 200:
             return f"❌ Could not access thread {thread_id}. It may not exist or may have expired."
         
         state = state_response.json()
         values = state.get("values", {})
         
-        # Check for final report
-        final_report = values.get("final_report")
-        if final_report:
-            return f"""RESEARCH_REPORT_COMPLETE
-
-{final_report}
-
-[INSTRUCTION: Present the above research report to the user exactly as written, without summarizing, modifying, or adding commentary. This is the complete, final research report.]"""
-        
         # Check for clarification request
-        messages = values.get("messages", [])
-        if messages:
-            last_message = messages[-1]
-            if hasattr(last_message, 'content'):
-                content = last_message.content
-            elif isinstance(last_message, dict):
-                content = last_message.get('content', '')
-            else:
-                content = str(last_message)
-            
-            if content and ('?' in content or 'clarify' in content.lower() or 'specify' in content.lower()):
-                return f"🤔 **Clarification Needed**\n\n{content}\n\n*Use `continue_research_with_clarification()` with thread_id='{thread_id}' to provide your answer.*"
+        question = clarification_request(values)
+        if question:
+            return f"🤔 **Clarification Needed**\n\n{question}\n\n*Use `continue_research_with_clarification()` with thread_id='{thread_id}' to provide your answer.*"
         
         # Check if research is still running
         thread_status = state.get("status", "unknown")
@@ -298,10 +252,10 @@ def get_research_by_thread_id(thread_id: str) -> str:
         return f"❌ Error retrieving results: {str(e)}"
 
 @mcp.tool()
-def check_research_status() -> str:
+async def check_research_status() -> str:
     """Check if the Deep Research server is running and ready."""
     try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+        response = await client.get("/docs", timeout=5)
         if response.status_code == 200:
             return "✅ Deep Research server is running and ready"
         else:
@@ -310,7 +264,7 @@ def check_research_status() -> str:
         return f"❌ Deep Research server not available: {str(e)}"
 
 @mcp.tool()
-def list_active_sessions() -> str:
+async def list_active_sessions() -> str:
     """
     List active research sessions for debugging/monitoring.
     
@@ -320,15 +274,17 @@ def list_active_sessions() -> str:
     if not active_sessions:
         return "No active research sessions."
     
-    result = "📋 **Active Research Sessions:**\n\n"
+    parts = ["📋 **Active Research Sessions:**\n\n"]
     for session_id, session in active_sessions.items():
-        elapsed = int(time.time() - session["started_at"])
-        result += f"• **Session {session_id}**\n"
-        result += f"  Thread ID: {session['thread_id']}\n"
-        result += f"  Question: {session['question'][:80]}...\n"
-        result += f"  Running for: {elapsed} seconds\n\n"
+        elapsed = int(time.monotonic() - session.started_at)
+        parts.append(
+            f"• **Session {session_id}**\n"
+            f"  Thread ID: {session.thread_id}\n"
+            f"  Question: {session.question[:80]}...\n"
+            f"  Running for: {elapsed} seconds\n\n"
+        )
     
-    return result
+    return "".join(parts)
 
 if __name__ == "__main__":
     mcp.run(transport="stdio")
\ No newline at end of file
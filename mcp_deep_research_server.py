@@ -5,11 +5,13 @@ Exposes the deep research functionality as MCP tools for AI agents.
 """
 
 import asyncio
-import json
 import logging
 from typing import Any, Sequence
-import requests
-import time
+import httpx
+from httpx_sse import aconnect_sse
+import orjson
+
+from assistant_cache import clear_assistant_id, load_assistant_id, save_assistant_id
 
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
@@ -27,6 +29,11 @@ import mcp.types as types
 # Configuration
 LANGGRAPH_API_URL = "http://localhost:2024"
 DEFAULT_TIMEOUT = 300  # 5 minutes
+ASSISTANT_GRAPH_ID = "Deep Researcher"
+
+# Pre-encoded request bodies - empty-object POSTs skip the JSON encoder entirely
+_EMPTY_JSON = b"{}"
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -37,155 +44,202 @@ class DeepResearchMCP:
         self.server = Server("deep-research")
         self.current_thread_id = None
         self.assistant_id = None
+        self._assistant_lock = asyncio.Lock()
+        # LangGraph rejects a second run on a busy thread (409) - runs on the session thread take turns
+        self._session_lock = asyncio.Lock()
         
-    def check_server(self) -> bool:
+        # One pooled async client for every LangGraph call - keeps connections alive across polls
+        # without blocking the event loop; failed connects are retried by the transport.
+        # HTTP/2 is used when the server (or a proxy in front of it) offers it, multiplexing calls
+        self.client = httpx.AsyncClient(
+            base_url=LANGGRAPH_API_URL,
+            headers={"Authorization": "Bearer dev-token"},
+            timeout=httpx.Timeout(10.0, read=30.0),
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            ),
+        )
+    
+    async def aclose(self):
+        """Close the HTTP client's pooled connections."""
+        await self.client.aclose()
+        
+    async def check_server(self) -> bool:
         """Check if the LangGraph server is running."""
         try:
-            response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+            response = await self.client.get("/docs", timeout=5)
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Server check failed: {e}")
             return False
     
-    def create_thread(self) -> str | None:
+    async def create_thread(self) -> str | None:
         """Create a new research thread."""
         try:
-            headers = {"Authorization": "Bearer dev-token"}
-            response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=headers)
+            response = await self.client.post("/threads", content=_EMPTY_JSON, headers=_JSON_HEADERS)
             if response.status_code in [200, 201]:
-                result = response.json()
+                result = orjson.loads(response.content)
                 thread_id = result.get("thread_id") or result.get("id")
                 logger.info(f"Created thread: {thread_id}")
                 return thread_id
+        except httpx.ConnectError:
+            raise
         except Exception as e:
             logger.error(f"Failed to create thread: {e}")
         return None
     
-    def get_or_create_assistant(self) -> str | None:
-        """Get or create the Deep Researcher assistant."""
+    async def get_or_create_assistant(self) -> str | None:
+        """Get or create the Deep Researcher assistant, reusing the one cached on disk by an earlier run."""
         if self.assistant_id:
             return self.assistant_id
+        
+        async with self._assistant_lock:
+            # Another caller may have resolved it while we waited
+            if self.assistant_id:
+                return self.assistant_id
             
-        try:
-            headers = {"Authorization": "Bearer dev-token"}
-            
-            # Try to search for existing assistants
-            response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=headers)
-            if response.status_code == 200:
-                assistants = response.json()
-                if assistants:
-                    self.assistant_id = assistants[0].get("assistant_id") or assistants[0].get("id")
-                    logger.info(f"Found existing assistant: {self.assistant_id}")
-                    return self.assistant_id
-            
-            # Create new assistant
-            payload = {
-                "graph_id": "Deep Researcher",
-                "name": "Deep Researcher",
-                "description": "AI research agent"
-            }
-            response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=headers)
-            if response.status_code in [200, 201]:
-                result = response.json()
-                self.assistant_id = result.get("assistant_id") or result.get("id")
-                logger.info(f"Created new assistant: {self.assistant_id}")
+            self.assistant_id = load_assistant_id(ASSISTANT_GRAPH_ID)
+            if self.assistant_id:
+                logger.info(f"Using cached assistant: {self.assistant_id}")
                 return self.assistant_id
-                
-        except Exception as e:
-            logger.error(f"Failed to get/create assistant: {e}")
-        
-        return None
-    
-    def wait_for_completion(self, thread_id: str, run_id: str, timeout: int = DEFAULT_TIMEOUT) -> str | None:
-        """Wait for the research run to complete and return the final report."""
-        headers = {"Authorization": "Bearer dev-token"}
-        wait_time = 0
-        
-        while wait_time < timeout:
+            
             try:
-                # Check run status
-                status_url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{run_id}"
-                response = requests.get(status_url, headers=headers)
-                
+                # Try to search for existing assistants
+                response = await self.client.post("/assistants/search", content=_EMPTY_JSON, headers=_JSON_HEADERS)
                 if response.status_code == 200:
-                    run_info = response.json()
-                    status = run_info.get("status")
-                    
-                    if status == "success":
-                        # Get the final state
-                        state_url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/state"
-                        state_response = requests.get(state_url, headers=headers)
-                        
-                        if state_response.status_code == 200:
-                            state_data = state_response.json()
-                            final_report = state_data.get("values", {}).get("final_report")
-                            if final_report:
-                                logger.info("Research completed successfully")
-                                return final_report
-                        
-                    elif status == "error":
-                        logger.error("Research run failed")
-                        return None
-                        
-                time.sleep(2)
-                wait_time += 2
+                    assistants = orjson.loads(response.content)
+                    if assistants:
+                        self.assistant_id = assistants[0].get("assistant_id") or assistants[0].get("id")
+                        logger.info(f"Found existing assistant: {self.assistant_id}")
+                        save_assistant_id(self.assistant_id, ASSISTANT_GRAPH_ID)
+                        return self.assistant_id
                 
+                # Create new assistant
+                payload = {
+                    "graph_id": ASSISTANT_GRAPH_ID,
+                    "name": "Deep Researcher",
+                    "description": "AI research agent"
+                }
+                response = await self.client.post("/assistants", content=orjson.dumps(payload), headers=_JSON_HEADERS)
+                if response.status_code in [200, 201]:
+                    result = orjson.loads(response.content)
+                    self.assistant_id = result.get("assistant_id") or result.get("id")
+                    logger.info(f"Created new assistant: {self.assistant_id}")
+                    save_assistant_id(self.assistant_id, ASSISTANT_GRAPH_ID)
+                    return self.assistant_id
+                    
+            except httpx.ConnectError:
+                raise
             except Exception as e:
-                logger.error(f"Error checking status: {e}")
-                return None
+                logger.error(f"Failed to get/create assistant: {e}")
+        
+        return None
+    
+    async def stream_research(self, thread_id: str, payload: dict) -> str | None:
+        """Start a run on the thread and follow its event stream, returning the final report."""
+        url = f"/threads/{thread_id}/runs/stream"
+        last_values = None
+        # No read timeout - the stream stays quiet between graph steps; the caller bounds the total wait
+        body = orjson.dumps({**payload, "stream_mode": "values", "on_disconnect": "continue"})
+        # aconnect_sse adds an Accept header to the dict it's given, so pass a fresh one
+        async with aconnect_sse(self.client, "POST", url, content=body, headers={"Content-Type": "application/json"},
+                                timeout=httpx.Timeout(10.0, read=None)) as event_source:
+            response = event_source.response
+            if response.status_code != 200:
+                await response.aread()
+                if response.status_code in (404, 422):
+                    # The cached assistant may be gone (e.g. the server was reset) - look it up again next time
+                    self.assistant_id = None
+                    clear_assistant_id()
+                raise Exception(f"Failed to start research: {response.status_code} - {response.text}")
+            
+            async for sse in event_source.aiter_sse():
+                if sse.event == "values":
+                    # Each event carries the full state - only the last one needs parsing
+                    last_values = sse.data
+                elif sse.event == "error":
+                    logger.error(f"Research run failed: {sse.data}")
+                    return None
+                elif sse.event == "end":
+                    break
         
-        logger.error("Research timed out")
+        if last_values:
+            final_report = orjson.loads(last_values).get("final_report")
+            if final_report:
+                logger.info("Research completed successfully")
+                return final_report
         return None
     
-    def conduct_research(self, question: str, timeout: int = DEFAULT_TIMEOUT, new_session: bool = False) -> str:
-        """Conduct research on the given question."""
-        # Check server availability
-        if not self.check_server():
+    async def setup_research(self, new_thread: bool) -> tuple[str, str]:
+        """Return the thread and assistant to run on - a new thread, or the current session's."""
+        # Thread and assistant setup are independent, so run them concurrently.
+        # There's no separate availability probe - a refused connection here means the server is down.
+        try:
+            if new_thread:
+                thread_id, assistant_id = await asyncio.gather(
+                    self.create_thread(), self.get_or_create_assistant()
+                )
+            else:
+                thread_id = self.current_thread_id
+                assistant_id = await self.get_or_create_assistant()
+        except httpx.ConnectError:
             raise Exception("LangGraph server is not running. Please start it first.")
         
-        # Create or reuse thread
-        if new_session or not self.current_thread_id:
-            self.current_thread_id = self.create_thread()
-            
-        if not self.current_thread_id:
+        if not thread_id:
             raise Exception("Failed to create research thread")
         
-        # Get assistant
-        assistant_id = self.get_or_create_assistant()
         if not assistant_id:
             raise Exception("Failed to get assistant")
         
+        return thread_id, assistant_id
+    
+    async def run_research(self, thread_id: str, assistant_id: str, question: str, timeout: int) -> str:
+        """Run the question on the thread and return the final report."""
         try:
-            headers = {"Authorization": "Bearer dev-token"}
-            
-            # Submit research
-            url = f"{LANGGRAPH_API_URL}/threads/{self.current_thread_id}/runs"
+            # Submit research and follow it to completion on the run's event stream
             payload = {
                 "assistant_id": assistant_id,
                 "input": {"messages": [{"role": "user", "content": question}]}
             }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code != 200:
-                raise Exception(f"Failed to start research: {response.status_code} - {response.text}")
-                
-            run_data = response.json()
-            run_id = run_data.get("run_id")
-            
-            if not run_id:
-                raise Exception("No run ID returned")
-            
-            # Wait for completion
-            final_report = self.wait_for_completion(self.current_thread_id, run_id, timeout)
+            try:
+                final_report = await asyncio.wait_for(
+                    self.stream_research(thread_id, payload), timeout
+                )
+            except asyncio.TimeoutError:
+                logger.error("Research timed out")
+                final_report = None
             
             if not final_report:
                 raise Exception("No final report was generated")
                 
             return final_report
             
+        except httpx.ConnectError:
+            logger.error("Research failed: LangGraph server is not reachable")
+            raise Exception("LangGraph server is not running. Please start it first.")
         except Exception as e:
             logger.error(f"Research failed: {e}")
             raise
+    
+    async def conduct_research(self, question: str, timeout: int = DEFAULT_TIMEOUT, new_session: bool = False,
+                               own_thread: bool = False) -> str:
+        """
+        Conduct research on the given question.
+        
+        By default the run goes on the session thread, one run at a time. With
+        own_thread it gets a new thread instead, so concurrent callers don't
+        queue behind each other or touch the session.
+        """
+        if own_thread:
+            thread_id, assistant_id = await self.setup_research(new_thread=True)
+            return await self.run_research(thread_id, assistant_id, question, timeout)
+        
+        async with self._session_lock:
+            thread_id, assistant_id = await self.setup_research(new_thread=new_session or not self.current_thread_id)
+            self.current_thread_id = thread_id
+            return await self.run_research(thread_id, assistant_id, question, timeout)
 
 # Initialize the MCP server
 research_mcp = DeepResearchMCP()
@@ -241,7 +295,7 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             logger.info(f"Starting research for: {question[:100]}...")
             
             # Conduct the research
-            report = research_mcp.conduct_research(question, timeout, new_session)
+            report = await research_mcp.conduct_research(question, timeout, new_session)
             
             return [types.TextContent(
                 type="text",
@@ -263,19 +317,22 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
 
 async def main():
     # Run the server using stdin/stdout loops
-    async with stdio_server() as (read_stream, write_stream):
-        await research_mcp.server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="deep-research",
-                server_version="1.0.0",
-                capabilities=research_mcp.server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await research_mcp.server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="deep-research",
+                    server_version="1.0.0",
+                    capabilities=research_mcp.server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        await research_mcp.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
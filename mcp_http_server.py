@@ -4,24 +4,82 @@ HTTP wrapper for the Deep Research MCP server.
 Exposes MCP tools as HTTP endpoints for OpenWebUI integration.
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
 import uvicorn
 import logging
-from mcp_deep_research_server import DeepResearchMCP
+import orjson
+import os
+import re
+import time
+from mcp_deep_research_server import DEFAULT_TIMEOUT, research_mcp
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mcp-http-server")
 
+# Whitespace-delimited words stand in for tokens in the usage block
+_WORD_RE = re.compile(r"\S+")
+
+def count_words(text: str) -> int:
+    """Count whitespace-delimited words without building the list str.split() would."""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Serve every request from the MCP server's research instance; close its HTTP client on shutdown."""
+    app.state.research = research_mcp
+    try:
+        yield
+    finally:
+        await app.state.research.aclose()
+
 app = FastAPI(
     title="Deep Research MCP HTTP Server",
     description="HTTP wrapper for Deep Research MCP tools",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize the research MCP instance
-research_mcp = DeepResearchMCP()
+# In-flight research, keyed by question - concurrent duplicates share one LangGraph run
+INFLIGHT: dict[str, asyncio.Task] = {}
+
+# Recently completed reports, keyed like INFLIGHT - a repeated question within the TTL skips the run.
+# Only touched from the event loop, so it needs no lock.
+REPORT_CACHE: TTLCache = TTLCache(maxsize=256, ttl=600)
+
+async def _research_and_cache(key: str, question: str, timeout: int) -> str:
+    """Conduct research and remember the report for later identical questions."""
+    # Each request runs on a thread of its own - sharing the MCP session thread would serialize them
+    report = await app.state.research.conduct_research(question, timeout, own_thread=True)
+    REPORT_CACHE[key] = report
+    return report
+
+async def research_once(question: str, timeout: int = DEFAULT_TIMEOUT, new_session: bool = False) -> tuple[str, bool]:
+    """
+    Conduct research, reusing a recent report or joining an identical question that is already running.
+    
+    Returns:
+        The report, and whether it came from the report cache
+    """
+    key = hashlib.blake2b(question.encode(), digest_size=16).hexdigest()
+    # Asking for a new session means fresh research, so skip the cache
+    if not new_session:
+        report = REPORT_CACHE.get(key)
+        if report is not None:
+            return report, True
+    
+    task = INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_research_and_cache(key, question, timeout))
+        INFLIGHT[key] = task
+        task.add_done_callback(lambda _: INFLIGHT.pop(key, None))
+    # Shield so one client disconnecting doesn't cancel the run others are waiting on
+    return await asyncio.shield(task), False
 
 class ResearchRequest(BaseModel):
     question: str
@@ -53,7 +111,7 @@ async def root():
 async def check_status():
     """Check if the deep research server is available."""
     try:
-        is_running = research_mcp.check_server()
+        is_running = await app.state.research.check_server()
         if is_running:
             return StatusResponse(
                 status="online",
@@ -69,23 +127,31 @@ async def check_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/research")
-async def conduct_research(request: ResearchRequest):
+async def conduct_research(request: ResearchRequest, response: Response):
     """Conduct deep research on a given question."""
     try:
         logger.info(f"Starting research for: {request.question[:100]}...")
         
-        report = research_mcp.conduct_research(
+        report, cache_hit = await research_once(
             question=request.question,
             timeout=request.timeout,
             new_session=request.new_session
         )
         
+        response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
         return ResearchResponse(report=report)
         
     except Exception as e:
         logger.error(f"Research failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fixed fields of every chat completion response
+_CHAT_SKELETON = {
+    "id": "research-response",
+    "object": "chat.completion",
+    "model": "deep-research",
+}
+
 # OpenWebUI-compatible endpoint
 @app.post("/v1/chat/completions")
 async def chat_completions(request: dict):
@@ -99,14 +165,15 @@ async def chat_completions(request: dict):
         user_message = messages[-1].get("content", "")
         
         # Conduct research
-        report = research_mcp.conduct_research(question=user_message)
+        report, cache_hit = await research_once(question=user_message)
+        
+        prompt_tokens = count_words(user_message)
+        completion_tokens = count_words(report)
         
-        # Return in OpenAI format
-        return {
-            "id": "research-response",
-            "object": "chat.completion",
-            "created": 1234567890,
-            "model": "deep-research",
+        # Return in OpenAI format - serialized straight to bytes, skipping FastAPI's encoder pass
+        completion = {
+            **_CHAT_SKELETON,
+            "created": int(time.time()),
             "choices": [{
                 "index": 0,
                 "message": {
@@ -116,11 +183,16 @@ async def chat_completions(request: dict):
                 "finish_reason": "stop"
             }],
             "usage": {
-                "prompt_tokens": len(user_message.split()),
-                "completion_tokens": len(report.split()),
-                "total_tokens": len(user_message.split()) + len(report.split())
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
             }
         }
+        return Response(
+            content=orjson.dumps(completion),
+            media_type="application/json",
+            headers={"X-Cache": "HIT" if cache_hit else "MISS"},
+        )
         
     except Exception as e:
         logger.error(f"Chat completion failed: {e}")
@@ -132,4 +204,13 @@ if __name__ == "__main__":
     print("OpenAPI docs at: http://localhost:8999/docs")
     print("Make sure your LangGraph API is running on http://localhost:2024")
     
-    uvicorn.run(app, host="0.0.0.0", port=8999)
\ No newline at end of file
+    # Workers are separate processes - each has its own HTTP client, INFLIGHT map and REPORT_CACHE
+    uvicorn.run(
+        "mcp_http_server:app",
+        host="0.0.0.0",
+        port=8999,
+        # "auto" picks uvloop and httptools when installed (uvicorn[standard], not on Windows), else asyncio and h11
+        loop="auto",
+        http="auto",
+        workers=min(4, os.cpu_count() or 1),
+    )
\ No newline at end of file
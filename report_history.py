@@ -0,0 +1,64 @@
+"""
+On-disk history of completed research reports for the Streamlit apps.
+
+Reports can be hundreds of KB each, so instead of keeping every one in
+``st.session_state`` for the life of a browser session they are written to a
+SQLite database (WAL mode). The UI lists questions from the index and reads a
+report body only when it renders it.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# Configuration
+HISTORY_DB_PATH = os.environ.get("RESEARCH_HISTORY_DB", "report_history.db")
+HISTORY_TTL = 24 * 60 * 60  # seconds a report is kept - user keys don't outlive their browser session
+
+
+class ReportHistory:
+    """Completed reports, grouped by a per-session user key."""
+
+    def __init__(self, db_path: str = HISTORY_DB_PATH):
+        # Streamlit serves each browser session on its own thread - share one connection behind a lock
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "id INTEGER PRIMARY KEY, user_key TEXT, ts REAL, question TEXT, report TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_user_key ON reports (user_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_ts ON reports (ts)")
+        self._lock = threading.Lock()
+
+    def add(self, user_key: str, question: str, report: Optional[str]) -> int:
+        """Save a completed report and return its ID, dropping reports older than HISTORY_TTL."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM reports WHERE ts < ?", (now - HISTORY_TTL,))
+            cursor = self._conn.execute(
+                "INSERT INTO reports (user_key, ts, question, report) VALUES (?, ?, ?, ?)",
+                (user_key, now, question, report),
+            )
+        return cursor.lastrowid
+
+    def entries(self, user_key: str) -> List[Tuple[int, float, str]]:
+        """Return (id, timestamp, question) for the user's reports, newest first - without the report bodies."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, ts, question FROM reports WHERE user_key = ? ORDER BY id DESC",
+                (user_key,),
+            ).fetchall()
+
+    def report(self, report_id: int) -> Optional[str]:
+        """Return the body of one report."""
+        with self._lock:
+            row = self._conn.execute("SELECT report FROM reports WHERE id = ?", (report_id,)).fetchone()
+        return row[0] if row else None
+
+    def clear(self, user_key: str) -> None:
+        """Delete all of the user's reports."""
+        with self._lock:
+            self._conn.execute("DELETE FROM reports WHERE user_key = ?", (user_key,))
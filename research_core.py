@@ -0,0 +1,279 @@
+"""
+Shared LangGraph plumbing for the async Deep Research MCP servers.
+
+async_research_mcp.py and async_research_mcp_final.py only differ in the
+tools they expose; the HTTP client, session sweeping, assistant/thread setup and
+run-completion helpers live here, so both servers share one connection pool
+and one copy of the code.
+"""
+
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import httpx
+import ijson
+from httpx_sse import SSEError, aconnect_sse
+import asyncio
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from semantic_cache import SemanticCache
+from session_store import SessionStore
+
+load_dotenv()
+
+# Configuration
+LANGGRAPH_API_URL = "http://localhost:2024"
+HEADERS = {"Authorization": "Bearer dev-token"}
+
+# Shared HTTP client - pooled keep-alive connections reused by every tool,
+# retrying failed connection attempts (e.g. while the dev server restarts)
+client = httpx.AsyncClient(
+    base_url=LANGGRAPH_API_URL,
+    headers=HEADERS,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    ),
+)
+
+# Servers currently running on the shared client - the last one to shut down closes it
+_running_servers = 0
+
+def make_lifespan(sessions: SessionStore):
+    """Build a server lifespan that sweeps the server's sessions."""
+    @asynccontextmanager
+    async def lifespan(server: Any):
+        """Bound the worker thread pool and sweep stale sessions; close the shared HTTP client after the last server."""
+        global _running_servers
+        # Blocking work (cache embeddings, SQLite) runs via asyncio.to_thread on this pool
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+        sweeper = asyncio.create_task(sweep_sessions(sessions))
+        _running_servers += 1
+        try:
+            yield
+        finally:
+            sweeper.cancel()
+            _running_servers -= 1
+            if not _running_servers:
+                await client.aclose()
+    return lifespan
+
+assistant_id: Optional[str] = None
+_assistant_lock = asyncio.Lock()
+semantic_cache = SemanticCache()
+
+# In-flight research runs, keyed by server and question - duplicates on the same server await the same task
+_inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+# Session eviction - failed sessions go on the next sweep, everything else once it outlives the longest wait
+SESSION_TTL = 2 * 720
+SWEEP_INTERVAL = 60
+
+async def sweep_sessions(sessions: SessionStore):
+    """Periodically drop failed and stale sessions so the store can't grow without bound."""
+    while True:
+        now = time.monotonic()
+        stale = [
+            session_id for session_id, session in sessions.items()
+            if session.status == "error" or now - session.started_at > SESSION_TTL
+        ]
+        for session_id in stale:
+            sessions.pop(session_id, None)
+        await asyncio.sleep(SWEEP_INTERVAL)
+
+async def coalesce(server: str, key: str, run: Callable[[], Awaitable[str]]) -> str:
+    """
+    Await run(), sharing a single in-flight task between concurrent callers with the same key.
+
+    Keys are scoped to the server, since each server formats its results for its own clients.
+    """
+    slot = (server, key)
+    task = _inflight.get(slot)
+    if task is None:
+        task = asyncio.create_task(run())
+        _inflight[slot] = task
+        task.add_done_callback(lambda _: _inflight.pop(slot, None))
+    # Shield so one caller going away doesn't cancel the run others are waiting on
+    return await asyncio.shield(task)
+
+# Heuristic for "the last message is asking the user for clarification"
+CLARIFY_RE = re.compile(r"[?]|clarify|specify", re.IGNORECASE)
+
+def clarification_request(values: Dict) -> Optional[str]:
+    """Return the last message of a thread's state values if it looks like a clarifying question."""
+    messages = values.get("messages", [])
+    if not messages:
+        return None
+
+    last_message = messages[-1]
+    if hasattr(last_message, 'content'):
+        content = last_message.content
+    elif isinstance(last_message, dict):
+        content = last_message.get('content', '')
+    else:
+        content = str(last_message)
+
+    if content and CLARIFY_RE.search(content):
+        return content
+    return None
+
+# Cached server availability probe
+SERVER_PROBE_TTL = 10.0
+_last_probe_ts = float("-inf")
+_last_probe_ok = False
+
+async def server_ok() -> bool:
+    """Check that the LangGraph server is reachable, reusing the last result for SERVER_PROBE_TTL seconds."""
+    global _last_probe_ts, _last_probe_ok
+    now = time.monotonic()
+    if now - _last_probe_ts < SERVER_PROBE_TTL:
+        return _last_probe_ok
+
+    try:
+        await client.get("/docs", timeout=5)
+        ok = True
+    except:
+        ok = False
+    _last_probe_ts = time.monotonic()
+    _last_probe_ok = ok
+    return ok
+
+async def get_assistant():
+    """Get or create assistant - cached globally.
+
+    Concurrent first-time callers are coalesced behind a lock so only one of
+    them searches for (or creates) the assistant.
+    """
+    global assistant_id
+    if assistant_id:
+        return assistant_id
+
+    async with _assistant_lock:
+        # Another caller may have resolved it while we waited
+        if assistant_id:
+            return assistant_id
+
+        try:
+            # Try to find existing assistant
+            response = await client.post("/assistants/search", json={})
+            if response.status_code == 200:
+                assistants = response.json()
+                if assistants:
+                    assistant_id = assistants[0]["assistant_id"]
+                    return assistant_id
+
+            # Create new one
+            payload = {"graph_id": "Deep Researcher", "name": "Research Assistant"}
+            response = await client.post("/assistants", json=payload)
+            if response.status_code in [200, 201]:
+                assistant_id = response.json()["assistant_id"]
+                return assistant_id
+        except:
+            pass
+    return None
+
+async def create_thread():
+    """Create a new thread."""
+    try:
+        response = await client.post("/threads", json={})
+        if response.status_code in [200, 201]:
+            return response.json()["thread_id"]
+    except:
+        pass
+    return None
+
+# Polling/reconnect backoff - full jitter, doubling up to the cap
+POLL_BASE_DELAY = 2.0
+POLL_MAX_DELAY = 30.0
+
+async def backoff_sleep(delay: float) -> float:
+    """Sleep a random time up to ``delay`` and return the next (doubled, capped) delay."""
+    await asyncio.sleep(random.uniform(0, delay))
+    return min(POLL_MAX_DELAY, delay * 2)
+
+async def join_run_stream(thread_id: str, run_id: str) -> Optional[str]:
+    """Follow the run's event stream until it ends. Returns the error payload if the run failed."""
+    stream_url = f"/threads/{thread_id}/runs/{run_id}/stream"
+    delay = POLL_BASE_DELAY
+    while True:
+        try:
+            # No read timeout - the stream stays quiet between graph steps; callers bound the total wait
+            async with aconnect_sse(client, "GET", stream_url, timeout=httpx.Timeout(30.0, read=None)) as event_source:
+                async for sse in event_source.aiter_sse():
+                    delay = POLL_BASE_DELAY
+                    if sse.event == "end":
+                        return None
+                    if sse.event == "error":
+                        return sse.data or "unknown error"
+            return None
+        except SSEError:
+            # Server doesn't offer the run stream - wait on the run status instead
+            return await long_poll_run(thread_id, run_id)
+        except httpx.TransportError:
+            # Dropped connection - rejoin the stream after a jittered backoff
+            delay = await backoff_sleep(delay)
+
+# Long-poll fallback - the server may hold a status request open for up to this many seconds
+LONG_POLL_WAIT = 20
+
+async def long_poll_run(thread_id: str, run_id: str) -> Optional[str]:
+    """
+    Wait for a run to finish by long-polling its status with ``Prefer: wait``.
+
+    Servers that ignore the header answer right away; after two immediate
+    answers with an unchanged status this drops to short polling with backoff.
+    Returns the error if the run failed, like join_run_stream().
+    """
+    run_url = f"/threads/{thread_id}/runs/{run_id}"
+    headers = {"Prefer": f"wait={LONG_POLL_WAIT}"}
+    timeout = httpx.Timeout(LONG_POLL_WAIT + 5.0, connect=5.0)
+    delay = POLL_BASE_DELAY
+    last_status = None
+    quick_repeats = 0
+    while True:
+        requested_at = time.monotonic()
+        try:
+            response = await client.get(run_url, headers=headers, timeout=timeout)
+        except httpx.TransportError:
+            delay = await backoff_sleep(delay)
+            continue
+        if response.status_code == 404:
+            return "run not found"
+        if response.status_code != 200:
+            delay = await backoff_sleep(delay)
+            continue
+
+        run = response.json()
+        status = run.get("status")
+        if status == "success":
+            return None
+        if status in ["error", "timeout", "interrupted"]:
+            return run.get("error") or status
+
+        if headers:
+            answered_at_once = time.monotonic() - requested_at < 1.0
+            quick_repeats = quick_repeats + 1 if answered_at_once and status == last_status else 0
+            last_status = status
+            if quick_repeats < 2:
+                continue
+            # Long-poll isn't honoured - stop asking for it
+            headers = {}
+        delay = await backoff_sleep(delay)
+
+async def fetch_final_report(thread_id: str) -> Optional[str]:
+    """Stream the thread state and pull out values.final_report without building the whole payload."""
+    reports = ijson.sendable_list()
+    parser = ijson.items_coro(reports, "values.final_report")
+    async with client.stream("GET", f"/threads/{thread_id}/state") as response:
+        if response.status_code != 200:
+            return None
+        async for chunk in response.aiter_bytes():
+            parser.send(chunk)
+            if reports:
+                return reports[0]
+    return None
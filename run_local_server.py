@@ -9,20 +9,25 @@ import time
 import sys
 import os
 import signal
+import select
 import requests
 from threading import Thread
 
-def check_server_health(url="http://127.0.0.1:2024", timeout=5):
-    """Check if the LangGraph server is running."""
+# Child process output goes to these files instead of a pipe nobody drains
+LANGGRAPH_LOG = "langgraph.log"
+STREAMLIT_LOG = "streamlit.log"
+
+def check_server_health(url="http://127.0.0.1:2024", timeout=5, path="/health"):
+    """Check if a local server answers its health endpoint."""
     try:
-        response = requests.get(f"{url}/health", timeout=timeout)
+        response = requests.get(f"{url}{path}", timeout=timeout)
         return response.status_code == 200
     except:
         return False
 
 def start_langgraph_server():
-    """Start the LangGraph development server."""
-    print("🚀 Starting LangGraph server...")
+    """Start the LangGraph development server in the background."""
+    print(f"🚀 Starting LangGraph server (logging to {LANGGRAPH_LOG})...")
     cmd = [
         "uvx", "--refresh", "--from", "langgraph-cli[inmem]", 
         "--with-editable", ".", "--python", "3.11", 
@@ -30,67 +35,72 @@ def start_langgraph_server():
     ]
     
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
-        
-        # Monitor server startup
-        for line in iter(process.stdout.readline, ''):
-            print(f"[LangGraph] {line.strip()}")
-            if "Server started" in line:
-                print("✅ LangGraph server is ready!")
-                break
-                
-        return process
+        with open(LANGGRAPH_LOG, "ab") as log:
+            return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
     except Exception as e:
         print(f"❌ Failed to start LangGraph server: {e}")
         return None
 
 def start_streamlit_app():
-    """Start the Streamlit application."""
-    print("🎨 Starting Streamlit app...")
+    """Start the Streamlit application in the background."""
+    print(f"🎨 Starting Streamlit app (logging to {STREAMLIT_LOG})...")
     cmd = ["streamlit", "run", "streamlit_app.py", "--server.port", "8501", "--server.address", "0.0.0.0"]
     
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
-        
-        # Monitor Streamlit startup
-        for line in iter(process.stdout.readline, ''):
-            print(f"[Streamlit] {line.strip()}")
-            if "You can now view your Streamlit app" in line:
-                print("✅ Streamlit app is ready!")
-                break
-                
-        return process
+        with open(STREAMLIT_LOG, "ab") as log:
+            return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
     except Exception as e:
         print(f"❌ Failed to start Streamlit app: {e}")
         return None
 
-def wait_for_server(max_attempts=30):
-    """Wait for LangGraph server to be ready."""
-    print("⏳ Waiting for LangGraph server to be ready...")
+def wait_for_server(process, name="LangGraph server", url="http://127.0.0.1:2024", path="/health", max_wait=60):
+    """Wait for a server's health endpoint, probing quickly at first and backing off to once a second."""
+    print(f"⏳ Waiting for {name} to be ready...")
     
-    for attempt in range(max_attempts):
-        if check_server_health():
-            print("✅ LangGraph server is healthy!")
+    deadline = time.monotonic() + max_wait
+    attempt = 0
+    while time.monotonic() < deadline:
+        if check_server_health(url, timeout=1, path=path):
+            print(f"✅ {name} is healthy!")
             return True
+        if process.poll() is not None:
+            print(f"❌ {name} exited with code {process.returncode} - see its log file")
+            return False
         
-        print(f"   Attempt {attempt + 1}/{max_attempts}...")
-        time.sleep(2)
+        time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        attempt += 1
     
-    print("❌ LangGraph server failed to start properly")
+    print(f"❌ {name} failed to start properly")
     return False
 
+def child_exit_waiter():
+    """
+    Return a function that blocks until a child process may have exited.
+    
+    On POSIX the supervisor sleeps until SIGCHLD arrives (delivered through a
+    wakeup pipe, so there's no work in the signal handler itself); elsewhere it
+    falls back to waking once a second. Call this before starting children.
+    """
+    if not hasattr(signal, "SIGCHLD"):
+        return lambda: time.sleep(1)
+    
+    reader, writer = os.pipe()
+    os.set_blocking(reader, False)
+    os.set_blocking(writer, False)
+    signal.set_wakeup_fd(writer)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    
+    def wait():
+        select.select([reader], [], [])
+        # Drain every queued wakeup byte - several children may have exited
+        try:
+            while os.read(reader, 512):
+                pass
+        except BlockingIOError:
+            pass
+    
+    return wait
+
 def main():
     """Main function to orchestrate the startup."""
     print("🔍 Open Deep Research - Local Server Startup")
@@ -104,6 +114,7 @@ def main():
         return
     
     processes = []
+    wait_for_child_exit = child_exit_waiter()
     
     try:
         # Start LangGraph server in background
@@ -112,8 +123,8 @@ def main():
             return
         processes.append(langgraph_process)
         
-        # Wait for server to be ready
-        if not wait_for_server():
+        # Wait for server to be ready - the first uvx run also installs the CLI, so allow extra time
+        if not wait_for_server(langgraph_process, max_wait=180):
             return
         
         # Start Streamlit app
@@ -122,6 +133,9 @@ def main():
             return
         processes.append(streamlit_process)
         
+        if not wait_for_server(streamlit_process, "Streamlit app", "http://127.0.0.1:8501", path="/_stcore/health"):
+            return
+        
         print("\n" + "=" * 50)
         print("🎉 Both services are running!")
         print("📊 LangGraph API: http://127.0.0.1:2024")
@@ -132,7 +146,7 @@ def main():
         print("\nPress Ctrl+C to stop both services")
         print("=" * 50)
         
-        # Keep running until interrupted
+        # Keep running until interrupted, waking only when a child exits
         try:
             while True:
                 # Check if processes are still running
@@ -140,7 +154,7 @@ def main():
                     if process.poll() is not None:
                         print(f"⚠️  Process {process.pid} has stopped")
                         return
-                time.sleep(1)
+                wait_for_child_exit()
                 
         except KeyboardInterrupt:
             print("\n🛑 Shutting down services...")
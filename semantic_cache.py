@@ -0,0 +1,111 @@
+"""
+Semantic cache for completed research reports.
+
+Reports are stored in SQLite keyed by an embedding of the question, so a
+near-duplicate question can be answered from cache instead of starting a new
+multi-minute LangGraph run. Embeddings come from a small local
+sentence-transformers model (``pip install "open_deep_research[cache]"``);
+without it the cache is disabled and every lookup misses. The cache is best
+effort: any error inside it (e.g. the model can't be downloaded offline) is
+logged and treated as a miss, never passed on to the research call.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Configuration
+CACHE_DB_PATH = os.environ.get("RESEARCH_CACHE_DB", "research_cache.db")
+EMBEDDING_MODEL = os.environ.get("RESEARCH_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SIMILARITY_THRESHOLD = 0.92
+CACHE_TTL = 24 * 60 * 60  # 24 hours
+
+logger = logging.getLogger("semantic-cache")
+
+
+class SemanticCache:
+    """Embedding-keyed report cache backed by a SQLite table."""
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, model_name: str = EMBEDDING_MODEL,
+                 threshold: float = SIMILARITY_THRESHOLD, ttl: float = CACHE_TTL):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self._model = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the optional embedding dependencies are installed."""
+        return SentenceTransformer is not None
+
+    def _embed(self, text: str) -> "np.ndarray":
+        """Embed text as a unit-length float32 vector, loading the model on first use (thread-safe)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the cache database on first use."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                "id INTEGER PRIMARY KEY, question TEXT, embedding BLOB, report TEXT, created_at REAL)"
+            )
+        return self._conn
+
+    def lookup(self, question: str) -> Optional[str]:
+        """Return a cached report for a semantically equivalent question, if one is fresh enough."""
+        if not self.enabled:
+            return None
+
+        try:
+            embedding = self._embed(question)
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT embedding, report FROM reports WHERE created_at >= ?",
+                    (time.time() - self.ttl,),
+                ).fetchall()
+            if not rows:
+                return None
+
+            # Embeddings are normalized, so the dot product is the cosine similarity
+            matrix = np.frombuffer(b"".join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+            scores = matrix @ embedding
+            best = int(scores.argmax())
+            if scores[best] >= self.threshold:
+                return rows[best][1]
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+        return None
+
+    def store(self, question: str, report: str) -> None:
+        """Cache a completed report for the question."""
+        if not self.enabled:
+            return
+
+        try:
+            embedding = self._embed(question)
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT INTO reports (question, embedding, report, created_at) VALUES (?, ?, ?, ?)",
+                    (question, embedding.tobytes(), report, time.time()),
+                )
+                db.execute("DELETE FROM reports WHERE created_at < ?", (time.time() - self.ttl,))
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
@@ -0,0 +1,93 @@
+"""
+Durable storage for research sessions.
+
+Sessions are kept in memory for fast access and written through to a SQLite
+database (WAL mode), so a server restart doesn't lose track of research runs
+that are still going on the LangGraph server. Each server's sessions are
+tagged with its name, so servers sharing the database only see their own.
+"""
+
+import os
+import sqlite3
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from typing import Dict, Iterator
+
+# Configuration
+SESSIONS_DB_PATH = os.environ.get("RESEARCH_SESSIONS_DB", "research_sessions.db")
+
+
+@dataclass(slots=True)
+class Session:
+    """Tracking info for one research session."""
+    thread_id: str
+    run_id: str
+    question: str
+    status: str
+    started_at: float  # time.monotonic() - only used for elapsed-time math
+
+
+class SessionStore(MutableMapping):
+    """Mapping of session ID to Session, persisted to SQLite.
+
+    Iteration order is start order, like a plain dict filled as sessions start.
+    Mutating a Session in place is not persisted on its own - assign it back
+    (``store[session_id] = session``) to save the change.
+    """
+
+    def __init__(self, server: str, db_path: str = SESSIONS_DB_PATH):
+        self._server = server
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, thread_id TEXT, run_id TEXT, question TEXT, status TEXT, started_at REAL, server TEXT)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "server" not in columns:
+            # Database written before sessions were tagged - its rows belong to no server
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN server TEXT")
+        self._sessions: Dict[str, Session] = {}
+        self._load()
+
+    def _load(self) -> None:
+        """Restore sessions saved by a previous process."""
+        # started_at is stored as wall-clock time; map it back onto this process's monotonic clock
+        offset = time.monotonic() - time.time()
+        rows = self._conn.execute(
+            "SELECT id, thread_id, run_id, question, status, started_at FROM sessions WHERE server = ? "
+            "ORDER BY started_at",
+            (self._server,),
+        )
+        for session_id, thread_id, run_id, question, status, started_at in rows:
+            self._sessions[session_id] = Session(thread_id, run_id, question, status, started_at + offset)
+
+    def __getitem__(self, session_id: str) -> Session:
+        return self._sessions[session_id]
+
+    def __setitem__(self, session_id: str, session: Session) -> None:
+        started_wall = session.started_at - time.monotonic() + time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, thread_id, run_id, question, status, started_at, server) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, session.thread_id, session.run_id, session.question, session.status, started_wall,
+             self._server),
+        )
+        self._sessions[session_id] = session
+
+    def __delitem__(self, session_id: str) -> None:
+        del self._sessions[session_id]
+        self._conn.execute("DELETE FROM sessions WHERE id = ? AND server = ?", (session_id, self._server))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sessions)
+
+    def __reversed__(self) -> Iterator[str]:
+        return reversed(self._sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._sessions
@@ -1,7 +1,16 @@
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from dataclasses import dataclass, field
+import orjson
+import threading
 import time
+from typing import Optional
+
+from assistant_cache import clear_assistant_id, load_assistant_id, save_assistant_id
 
 load_dotenv()
 
@@ -10,42 +19,103 @@ mcp = FastMCP("Deep Research")
 # Simple configuration
 LANGGRAPH_API_URL = "http://localhost:2024"
 HEADERS = {"Authorization": "Bearer dev-token"}
+ASSISTANT_GRAPH_ID = "Deep Researcher"
+
+# Pre-encoded request bodies - empty-object POSTs skip the JSON encoder entirely
+_EMPTY_JSON = b"{}"
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+RUN_TIMEOUT = 120  # 2 minutes max
+
+def iter_sse(response, deadline: Optional[float] = None):
+    """
+    Yield (event, data) pairs from a server-sent events response.
+    
+    The deadline (a time.monotonic() value) is checked on every line, heartbeats
+    included, so a run that only sends keep-alives still times out. Raises
+    TimeoutError once it has passed.
+    """
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+def make_session():
+    """One pooled session for every LangGraph call - keeps connections alive between calls."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@dataclass
+class State:
+    """State shared by all tool calls. Each research call keeps its own thread, so calls can run concurrently."""
+    assistant_id: Optional[str] = None
+    last_thread_id: Optional[str] = None  # Most recent research thread, for get_current_thread_info
+    session: requests.Session = field(default_factory=make_session)
+    lock: threading.Lock = field(default_factory=threading.Lock)
 
-# Global state - keep it simple
-current_thread_id = None
-assistant_id = None
+state = State()
 
 def get_assistant():
-    """Get or create assistant - simple approach."""
-    global assistant_id
-    if assistant_id:
-        return assistant_id
+    """Get or create assistant - simple approach, remembered on disk across restarts."""
+    if state.assistant_id:
+        return state.assistant_id
     
-    try:
-        # Try to find existing assistant
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=HEADERS)
-        if response.status_code == 200:
-            assistants = response.json()
-            if assistants:
-                assistant_id = assistants[0]["assistant_id"]
-                return assistant_id
+    with state.lock:
+        # Another caller may have resolved it while we waited
+        if state.assistant_id:
+            return state.assistant_id
         
-        # Create new one
-        payload = {"graph_id": "Deep Researcher", "name": "Research Assistant"}
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=HEADERS)
-        if response.status_code in [200, 201]:
-            assistant_id = response.json()["assistant_id"]
-            return assistant_id
-    except:
-        pass
+        state.assistant_id = load_assistant_id(ASSISTANT_GRAPH_ID)
+        if state.assistant_id:
+            return state.assistant_id
+        
+        try:
+            # Try to find existing assistant
+            response = state.session.post(f"{LANGGRAPH_API_URL}/assistants/search", data=_EMPTY_JSON, headers=_JSON_HEADERS)
+            if response.status_code == 200:
+                assistants = orjson.loads(response.content)
+                if assistants:
+                    state.assistant_id = assistants[0]["assistant_id"]
+                    save_assistant_id(state.assistant_id, ASSISTANT_GRAPH_ID)
+                    return state.assistant_id
+            
+            # Create new one
+            payload = {"graph_id": ASSISTANT_GRAPH_ID, "name": "Research Assistant"}
+            response = state.session.post(f"{LANGGRAPH_API_URL}/assistants", data=orjson.dumps(payload), headers=_JSON_HEADERS)
+            if response.status_code in [200, 201]:
+                state.assistant_id = orjson.loads(response.content)["assistant_id"]
+                save_assistant_id(state.assistant_id, ASSISTANT_GRAPH_ID)
+                return state.assistant_id
+        except requests.exceptions.ConnectionError:
+            raise
+        except:
+            pass
     return None
 
 def create_thread():
     """Create a new thread - simple approach."""
     try:
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=HEADERS)
+        response = state.session.post(f"{LANGGRAPH_API_URL}/threads", data=_EMPTY_JSON, headers=_JSON_HEADERS)
         if response.status_code in [200, 201]:
-            return response.json()["thread_id"]
+            return orjson.loads(response.content)["thread_id"]
+    except requests.exceptions.ConnectionError:
+        raise
     except:
         pass
     return None
@@ -61,59 +131,65 @@ def research_question(question: str) -> str:
     Returns:
         The research results or status
     """
-    global current_thread_id
-    
-    # Check server
+    # No separate availability probe - a refused connection on the first real call means the server is down
     try:
-        requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
-    except:
+        # Get assistant
+        assistant = get_assistant()
+        if not assistant:
+            return "❌ Could not get research assistant"
+        
+        # Create this call's own thread
+        thread_id = create_thread()
+        if not thread_id:
+            return "❌ Could not create research thread"
+    except requests.exceptions.ConnectionError:
         return "❌ Deep Research server not available at http://localhost:2024"
-    
-    # Get assistant
-    assistant = get_assistant()
-    if not assistant:
-        return "❌ Could not get research assistant"
-    
-    # Create thread
-    current_thread_id = create_thread()
-    if not current_thread_id:
-        return "❌ Could not create research thread"
+    state.last_thread_id = thread_id
     
     try:
-        # Start research
+        # Start research and follow it on the run's event stream -
+        # if we give up waiting, the run keeps going on the server
         payload = {
             "assistant_id": assistant,
-            "input": {"messages": [{"role": "user", "content": question}]}
+            "input": {"messages": [{"role": "user", "content": question}]},
+            "stream_mode": "values",
+            "on_disconnect": "continue",
         }
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads/{current_thread_id}/runs", 
-                               json=payload, headers=HEADERS)
-        
-        if response.status_code != 200:
-            return f"❌ Failed to start research: {response.text}"
+        deadline = time.monotonic() + RUN_TIMEOUT
+        with state.session.post(f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/stream",
+                          data=orjson.dumps(payload), headers=_JSON_HEADERS,
+                          stream=True, timeout=(5, RUN_TIMEOUT)) as response:
+            if response.status_code != 200:
+                if response.status_code in (404, 422):
+                    # The cached assistant may be gone (e.g. the server was reset) - look it up again next time
+                    state.assistant_id = None
+                    clear_assistant_id()
+                return f"❌ Failed to start research: {response.text}"
+            
+            last_values = None
+            for event, data in iter_sse(response, deadline):
+                if event == "values":
+                    # Each event carries the full state - only the last one needs parsing
+                    last_values = data
+                elif event == "error":
+                    return f"❌ Research failed: {data}"
+                elif event == "end":
+                    break
         
-        run_id = response.json()["run_id"]
+        if last_values:
+            final_report = orjson.loads(last_values).get("final_report")
+            if final_report:
+                return f"# Research Results\n\n**Question:** {question}\n\n{final_report}"
         
-        # Wait for completion (simple polling)
-        for _ in range(60):  # 2 minutes max
-            time.sleep(2)
-            status_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{current_thread_id}/runs/{run_id}", 
-                                         headers=HEADERS)
-            if status_response.status_code == 200:
-                status = status_response.json().get("status")
-                if status == "success":
-                    # Get results
-                    state_response = requests.get(f"{LANGGRAPH_API_URL}/threads/{current_thread_id}/state", 
-                                                headers=HEADERS)
-                    if state_response.status_code == 200:
-                        state = state_response.json()
-                        final_report = state.get("values", {}).get("final_report")
-                        if final_report:
-                            return f"# Research Results\n\n**Question:** {question}\n\n{final_report}"
-                elif status in ["error", "timeout", "interrupted"]:
-                    return f"❌ Research failed with status: {status}"
+        return "❌ Research finished without a final report."
         
+    except (TimeoutError, requests.exceptions.ReadTimeout):
         return "⏰ Research is taking longer than expected. Check back later."
-        
+    except requests.exceptions.ConnectionError as e:
+        # requests reports a read timeout mid-stream as a ConnectionError wrapping urllib3's
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            return "⏰ Research is taking longer than expected. Check back later."
+        return f"❌ Research error: {str(e)}"
     except Exception as e:
         return f"❌ Research error: {str(e)}"
 
@@ -126,7 +202,7 @@ def check_research_status() -> str:
         Server status message
     """
     try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+        response = state.session.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
         if response.status_code == 200:
             return "✅ Deep Research server is running and ready"
         else:
@@ -142,14 +218,15 @@ def get_current_thread_info() -> str:
     Returns:
         Thread information or status
     """
-    if not current_thread_id:
+    thread_id = state.last_thread_id
+    if not thread_id:
         return "No active research thread"
     
     try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/threads/{current_thread_id}/state", headers=HEADERS)
+        response = state.session.get(f"{LANGGRAPH_API_URL}/threads/{thread_id}/state")
         if response.status_code == 200:
-            state = response.json()
-            return f"Thread ID: {current_thread_id}\nStatus: {state.get('status', 'unknown')}"
+            thread_state = orjson.loads(response.content)
+            return f"Thread ID: {thread_id}\nStatus: {thread_state.get('status', 'unknown')}"
         else:
             return f"Could not get thread info: {response.status_code}"
     except Exception as e:
@@ -5,25 +5,59 @@ A simple web UI to interact with the Deep Research agent locally.
 """
 
 import streamlit as st
-import requests
-import json
+import httpx
+import orjson
 import time
 from datetime import datetime
 import uuid
 
+from report_history import HISTORY_TTL, ReportHistory
+
 # Configuration
 LANGGRAPH_API_URL = "http://localhost:2024"
 
+@st.cache_resource
+def get_client():
+    """
+    Pooled HTTP client shared across reruns and browser sessions - keeps LangGraph connections alive.
+
+    HTTP/2 lets the fallback submissions and the run stream share one
+    connection when the server speaks it (https); plain http stays on HTTP/1.1.
+    """
+    return httpx.Client(
+        http2=True,
+        base_url=LANGGRAPH_API_URL,
+        headers={"Authorization": "Bearer dev-token"},  # json= bodies set their own Content-Type
+        timeout=httpx.Timeout(300.0, connect=5.0),
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=4),
+    )
+
+@st.cache_resource
+def get_history():
+    """On-disk report history, opened once per server process."""
+    return ReportHistory()
+
+@st.cache_data(ttl=HISTORY_TTL, max_entries=50)
+def load_history(user_key):
+    """(id, timestamp, question) rows of a session's history, newest first - report bodies are read on demand."""
+    return get_history().entries(user_key)
+
+def clear_history():
+    """Delete this session's saved reports."""
+    get_history().clear(st.session_state.history_key)
+    load_history.clear()
+
+@st.cache_data(ttl=5)
 def check_server_health():
-    """Check if the LangGraph server is running."""
+    """Check if the LangGraph server is running (cached for a few seconds - every rerun asks)."""
     try:
         # Try the docs endpoint since we know it works
-        response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+        response = get_client().get("/docs", timeout=5)
         return response.status_code == 200
     except:
         try:
             # Fallback to root endpoint
-            response = requests.get(LANGGRAPH_API_URL, timeout=5)
+            response = get_client().get("/", timeout=5)
             return response.status_code in [200, 404]  # 404 is also OK, means server is running
         except:
             return False
@@ -31,13 +65,7 @@ def check_server_health():
 def create_thread():
     """Create a new conversation thread."""
     try:
-        # Add authorization header for development
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer dev-token"
-        }
-        
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=headers)
+        response = get_client().post("/threads", json={})
         if response.status_code in [200, 201]:
             result = response.json()
             # Handle different possible response formats
@@ -55,189 +83,223 @@ def create_thread():
         st.error(f"Failed to create thread: {e}")
         return None
 
-def get_assistant_id():
-    """Get the Deep Researcher assistant ID."""
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer dev-token"
-        }
-        
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=headers)
-        if response.status_code == 200:
-            assistants = response.json()
-            
-            # Debug: Show what assistants we found
-            st.write(f"Found {len(assistants)} assistants:")
-            for i, assistant in enumerate(assistants):
-                st.write(f"Assistant {i}: {assistant}")
-            
-            # Look for the Deep Researcher assistant
-            for assistant in assistants:
-                if assistant.get("name") == "Deep Researcher":
-                    return assistant.get("assistant_id")
-            
-            # If not found by name, return the first one
-            if assistants:
-                first_assistant = assistants[0]
-                assistant_id = first_assistant.get("assistant_id") or first_assistant.get("id")
-                st.info(f"Using first available assistant: {first_assistant.get('name', 'Unknown')} (ID: {assistant_id})")
-                return assistant_id
-                
-        else:
-            st.error(f"Assistant search failed: {response.status_code} - {response.text}")
-        return None
-    except Exception as e:
-        st.error(f"Failed to get assistant ID: {e}")
-        return None
+def start_thread():
+    """Create a thread for this browser session, keeping the short ID shown in the UI alongside it."""
+    thread_id = create_thread()
+    st.session_state.thread_id = thread_id
+    st.session_state.thread_id_short = thread_id[:8] if thread_id else None
+    return thread_id
 
 def submit_research_query(thread_id, question):
-    """Submit a research query and stream the response."""
+    """Submit a research query and stream the response.
+
+    The approaches are tried one after another - each POST starts a run, so
+    they must not be raced. Whichever one works is remembered for the rest of
+    the session and tried first next time.
+    """
     try:
-        # Try different approaches to submit the research query
-        
-        # Approach 1: Try with graph name directly
-        url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/stream"
-        payload = {
-            "graph_id": "Deep Researcher",  # Use graph_id instead of assistant_id
-            "input": {
-                "messages": [{"role": "user", "content": question}]
-            }
+        client = get_client()
+        path = f"/threads/{thread_id}/runs/stream"
+        run_input = {
+            "messages": [{"role": "user", "content": question}]
         }
+        # Stream LLM messages as well as state snapshots, so progress can be shown while the run works
+        stream_mode = ["values", "messages"]
+        # Let the run finish server-side even if we close the stream early
+        on_disconnect = "continue"
         
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer dev-token"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, stream=True)
-        
-        if response.status_code == 200:
-            return response
-        
-        # Approach 2: Try without graph_id/assistant_id (some APIs auto-detect)
-        payload = {
-            "input": {
-                "messages": [{"role": "user", "content": question}]
-            }
-        }
+        # Try different approaches to submit the research query:
+        # 1. With graph name directly, 2. without graph_id/assistant_id (some APIs auto-detect),
+        # 3. creating an assistant first (None - only created if the others fail)
+        approaches = [{"graph_id": "Deep Researcher"}, {}, None]
+        known = st.session_state.get("submit_approach")
+        if known is not None:
+            # Go straight to what worked last time, keeping the rest as fallbacks
+            approaches = [known] + [approach for approach in approaches if approach != known]
         
-        response = requests.post(url, json=payload, headers=headers, stream=True)
-        
-        if response.status_code == 200:
-            return response
-        
-        # Approach 3: Try creating an assistant first
-        assistant_id = create_assistant_if_needed()
-        if assistant_id:
-            payload = {
-                "assistant_id": assistant_id,
-                "input": {
-                    "messages": [{"role": "user", "content": question}]
-                }
-            }
+        response = None
+        for approach in approaches:
+            if approach is None:
+                try:
+                    assistant_id = create_assistant_if_needed()
+                except Exception as e:
+                    st.warning(f"Failed to get assistant: {e}")
+                    continue
+                approach = {"assistant_id": assistant_id}
             
-            response = requests.post(url, json=payload, headers=headers, stream=True)
+            request = client.build_request("POST", path, json={**approach, "input": run_input, "stream_mode": stream_mode, "on_disconnect": on_disconnect})
+            response = client.send(request, stream=True)
             
             if response.status_code == 200:
+                st.session_state.submit_approach = approach
                 return response
+            # Failed attempt - keep the error body for the message below and release the connection now,
+            # rather than leaving it checked out while the next approach is tried
+            response.read()
+            response.close()
+            if "assistant_id" in approach and response.status_code in [404, 422]:
+                # The cached assistant may be gone (e.g. the server was reset) - look it up again next time
+                create_assistant_if_needed.clear()
         
-        st.error(f"All approaches failed. Last API Error: {response.status_code} - {response.text}")
+        st.session_state.pop("submit_approach", None)
+        if response is not None:
+            st.error(f"All approaches failed. Last API Error: {response.status_code} - {response.text}")
+        else:
+            st.error("All approaches failed.")
         return None
             
     except Exception as e:
         st.error(f"Request failed: {e}")
         return None
 
+@st.cache_resource(ttl=3600)
 def create_assistant_if_needed():
-    """Create the Deep Researcher assistant if it doesn't exist."""
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": "Bearer dev-token"
-        }
-        
-        # Try to create an assistant
-        payload = {
-            "graph_id": "Deep Researcher",
-            "name": "Deep Researcher",
-            "description": "AI-powered deep research agent"
-        }
-        
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=headers)
-        
-        if response.status_code in [200, 201]:
-            result = response.json()
-            assistant_id = result.get("assistant_id") or result.get("id")
-            st.success(f"Created assistant: {assistant_id}")
-            return assistant_id
-        else:
-            st.warning(f"Could not create assistant: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        st.warning(f"Failed to create assistant: {e}")
-        return None
+    """Get the Deep Researcher assistant ID, creating the assistant if the server has none.
 
-def parse_streaming_response(response):
-    """Parse the streaming response from LangGraph."""
-    messages = []
-    final_report = None
+    Cached, since the ID doesn't change while the server runs. Failures raise
+    instead of returning None so a missing ID is never cached.
+    """
+    client = get_client()
+    response = client.post("/assistants/search", json={})
+    if response.status_code != 200:
+        raise RuntimeError(f"Assistant search failed: {response.status_code} - {response.text}")
+    assistants = response.json()
+    
+    # Look for the Deep Researcher assistant
+    for assistant in assistants:
+        if assistant.get("name") == "Deep Researcher":
+            return assistant.get("assistant_id")
+    
+    # Not there yet - create it
+    payload = {
+        "graph_id": "Deep Researcher",
+        "name": "Deep Researcher",
+        "description": "AI-powered deep research agent"
+    }
+    response = client.post("/assistants", json=payload)
+    if response.status_code not in [200, 201]:
+        raise RuntimeError(f"Could not create assistant: {response.status_code} - {response.text}")
+    result = response.json()
+    return result.get("assistant_id") or result.get("id")
+
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a server-sent events response, splitting raw chunks on frame boundaries."""
+    buffer = b""
+    for chunk in response.iter_bytes():
+        buffer = (buffer + chunk).replace(b"\r\n", b"\n")
+        *frames, buffer = buffer.split(b"\n\n")
+        for frame in frames:
+            event, data = None, []
+            for line in frame.split(b"\n"):
+                if line.startswith(b"event:"):
+                    event = line[6:].strip().decode()
+                elif line.startswith(b"data:"):
+                    data.append(line[5:].lstrip())
+            data = b"\n".join(data)
+            # Skip heartbeats and end-of-stream sentinels without parsing them
+            if data and data != b"[DONE]":
+                yield event, data
+
+def parse_streaming_response(response, placeholder):
+    """
+    Parse the streaming response from LangGraph and return the run's final report.
+
+    Message updates are rendered into placeholder as they arrive, each one
+    replacing the last, and then dropped. Only the latest values payload is
+    kept; the report is read from it once the run ends. On a reused thread the
+    first values event still carries the previous report, so the stream is
+    only left early for a report that differs from it.
+    """
+    last_values = None
+    previous_report = None
     
     try:
-        for line in response.iter_lines():
-            if line:
-                line_str = line.decode('utf-8')
-                if line_str.startswith('data: '):
-                    data_str = line_str[6:]  # Remove 'data: ' prefix
-                    if data_str.strip() and data_str != '[DONE]':
-                        try:
-                            data = json.loads(data_str)
-                            
-                            # Handle different event types
-                            if isinstance(data, list) and len(data) >= 2:
-                                event_type, event_data = data[0], data[1]
-                                
-                                if event_type == "messages/partial":
-                                    # Handle partial message updates
-                                    if isinstance(event_data, list):
-                                        for msg in event_data:
-                                            if isinstance(msg, dict) and msg.get("content"):
-                                                messages.append({
-                                                    "type": "partial",
-                                                    "content": msg["content"],
-                                                    "timestamp": datetime.now()
-                                                })
-                                
-                                elif event_type == "messages/complete":
-                                    # Handle complete messages
-                                    if isinstance(event_data, list):
-                                        for msg in event_data:
-                                            if isinstance(msg, dict) and msg.get("content"):
-                                                messages.append({
-                                                    "type": "complete",
-                                                    "content": msg["content"],
-                                                    "timestamp": datetime.now()
-                                                })
-                                
-                                elif event_type == "values":
-                                    # Handle final values/report
-                                    if isinstance(event_data, dict):
-                                        if "final_report" in event_data:
-                                            final_report = event_data["final_report"]
-                                        elif "messages" in event_data:
-                                            # Extract final message
-                                            msgs = event_data["messages"]
-                                            if msgs and isinstance(msgs[-1], dict):
-                                                final_report = msgs[-1].get("content")
-                                
-                        except json.JSONDecodeError:
-                            continue
+        for event_type, data_bytes in iter_sse_events(response):
+            if event_type == "end":
+                break
+            
+            try:
+                data = orjson.loads(data_bytes)
+            except orjson.JSONDecodeError:
+                continue
+            
+            # Some servers send [event_type, event_data] pairs in the data field
+            if isinstance(data, list) and len(data) == 2 and isinstance(data[0], str):
+                event_type, data = data
+            
+            # Handle different event types
+            if event_type in ["messages/partial", "messages/complete"]:
+                # Each update carries the whole message so far - show the latest one
+                if isinstance(data, list) and data and isinstance(data[-1], dict):
+                    content = data[-1].get("content")
+                    if content and isinstance(content, str):
+                        placeholder.markdown(content)
+            
+            elif event_type == "values" and isinstance(data, dict):
+                if last_values is None:
+                    # State at run start - any report in it is from an earlier run
+                    previous_report = data.get("final_report")
+                elif data.get("final_report") and data["final_report"] != previous_report:
+                    # The new report is the run's last output; the run keeps going server-side if we leave
+                    last_values = data
+                    break
+                last_values = data
                             
     except Exception as e:
         st.error(f"Error parsing response: {e}")
+    finally:
+        response.close()
     
-    return messages, final_report
+    if not last_values:
+        return None
+    if last_values.get("final_report") and last_values["final_report"] != previous_report:
+        return last_values["final_report"]
+    # Fall back to the final message
+    msgs = last_values.get("messages")
+    if msgs and isinstance(msgs[-1], dict):
+        return msgs[-1].get("content")
+    return None
+
+@st.fragment
+def render_history():
+    """
+    Show the session's research history.
+
+    Runs as a fragment, so widgets in here only rerun this block. A report
+    body is only read and sent to the browser once its entry is switched on -
+    by default just the latest one.
+    """
+    history = load_history(st.session_state.history_key)
+    if not history:
+        return
+    
+    st.header("📚 Research History")
+    
+    for report_id, ts, question in history:
+        timestamp = datetime.fromtimestamp(ts)
+        is_latest = report_id == st.session_state.last_report_id
+        with st.expander(f"🔍 {question[:100]}..." if len(question) > 100 else f"🔍 {question}", expanded=is_latest):
+            st.markdown(f"**Asked:** {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
+            
+            if not st.toggle("Show report", value=is_latest, key=f"hist_{report_id}"):
+                continue
+            
+            report = get_history().report(report_id)
+            if report:
+                st.markdown("### 📄 Research Report")
+                st.markdown(report)
+            else:
+                st.warning("No final report available for this research.")
+            
+            # Download option
+            if report:
+                st.download_button(
+                    label="📥 Download Report",
+                    data=report,
+                    file_name=f"research_report_{timestamp.strftime('%Y%m%d_%H%M%S')}.md",
+                    mime="text/markdown",
+                    key=f"download_history_{report_id}"
+                )
 
 def main():
     st.set_page_config(
@@ -249,8 +311,9 @@ def main():
     st.title("🔍 Open Deep Research")
     st.markdown("*AI-powered deep research agent using Azure OpenAI*")
     
-    # Check server status
-    if not check_server_health():
+    # Check server status - once per rerun, the status column reuses the result
+    server_ok = check_server_health()
+    if not server_ok:
         st.error("⚠️ LangGraph server is not running!")
         st.markdown("""
         Please start the server first:
@@ -265,8 +328,11 @@ def main():
     # Initialize session state
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
-    if "research_history" not in st.session_state:
-        st.session_state.research_history = []
+        st.session_state.thread_id_short = None
+    if "history_key" not in st.session_state:
+        # Reports live on disk under this key; session state only remembers the latest one's ID
+        st.session_state.history_key = uuid.uuid4().hex
+        st.session_state.last_report_id = None
     
     # Sidebar for configuration
     with st.sidebar:
@@ -274,15 +340,17 @@ def main():
         
         # Thread management
         if st.button("🔄 New Research Session"):
-            st.session_state.thread_id = create_thread()
-            st.session_state.research_history = []
+            # Also forget the cached assistant, in case the server was restarted
+            create_assistant_if_needed.clear()
+            start_thread()
+            clear_history()
             if st.session_state.thread_id:
                 st.success(f"New session created!")
             else:
                 st.error("Failed to create new session")
         
         if st.session_state.thread_id:
-            st.info(f"Session ID: {st.session_state.thread_id[:8]}...")
+            st.info(f"Session ID: {st.session_state.thread_id_short}...")
         
         st.markdown("---")
         
@@ -320,7 +388,7 @@ def main():
         # Handle research submission
         if submit_button and research_question.strip():
             if not st.session_state.thread_id:
-                st.session_state.thread_id = create_thread()
+                start_thread()
             
             if st.session_state.thread_id:
                 with st.spinner("🔍 Conducting research... This may take a few minutes."):
@@ -332,21 +400,20 @@ def main():
                     response = submit_research_query(st.session_state.thread_id, research_question)
                     
                     if response:
-                        # Parse streaming response
-                        messages, final_report = parse_streaming_response(response)
+                        # Parse streaming response, showing progress as it streams in
+                        report_placeholder = st.empty()
+                        final_report = parse_streaming_response(response, report_placeholder)
+                        report_placeholder.empty()
                         
                         # Update progress
                         progress_bar.progress(100)
                         status_placeholder.success("✅ Research completed!")
                         
                         # Store in history
-                        research_entry = {
-                            "question": research_question,
-                            "report": final_report,
-                            "timestamp": datetime.now(),
-                            "messages": messages
-                        }
-                        st.session_state.research_history.append(research_entry)
+                        st.session_state.last_report_id = get_history().add(
+                            st.session_state.history_key, research_question, final_report
+                        )
+                        load_history.clear()
                         
                         # Display result
                         if final_report:
@@ -363,13 +430,9 @@ def main():
         st.header("Server Status")
         
         # Server info
-        try:
-            response = requests.get(f"{LANGGRAPH_API_URL}/docs")
-            if response.status_code == 200:
-                st.success("🟢 API Server: Online")
-            else:
-                st.error("🔴 API Server: Error")
-        except:
+        if server_ok:
+            st.success("🟢 API Server: Online")
+        else:
             st.error("🔴 API Server: Offline")
         
         st.markdown(f"**Server URL:** `{LANGGRAPH_API_URL}`")
@@ -382,31 +445,11 @@ def main():
             st.markdown(f"[Open API Documentation]({LANGGRAPH_API_URL}/docs)")
         
         if st.button("🧹 Clear History"):
-            st.session_state.research_history = []
+            clear_history()
             st.success("History cleared!")
     
     # Display research history
-    if st.session_state.research_history:
-        st.header("📚 Research History")
-        
-        for i, entry in enumerate(reversed(st.session_state.research_history)):
-            with st.expander(f"🔍 {entry['question'][:100]}..." if len(entry['question']) > 100 else f"🔍 {entry['question']}", expanded=(i==0)):
-                st.markdown(f"**Asked:** {entry['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                if entry['report']:
-                    st.markdown("### 📄 Research Report")
-                    st.markdown(entry['report'])
-                else:
-                    st.warning("No final report available for this research.")
-                
-                # Download option
-                if entry['report']:
-                    st.download_button(
-                        label="📥 Download Report",
-                        data=entry['report'],
-                        file_name=f"research_report_{entry['timestamp'].strftime('%Y%m%d_%H%M%S')}.md",
-                        mime="text/markdown"
-                    )
+    render_history()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,17 +5,44 @@ Clean, focused implementation that properly extracts the final report.
 """
 
 import streamlit as st
-import requests
-import json
+import httpx
+import orjson
+import time
+import uuid
 from datetime import datetime
 
+from report_history import HISTORY_TTL, ReportHistory
+
 # Configuration
 LANGGRAPH_API_URL = "http://localhost:2024"
+MAX_WAIT = 300  # 5 minutes max
+
+@st.cache_resource
+def get_client():
+    """Pooled HTTP client shared across reruns and browser sessions - HTTP/2 where the server offers it (https)."""
+    return httpx.Client(
+        http2=True,
+        base_url=LANGGRAPH_API_URL,
+        headers={"Authorization": "Bearer dev-token"},  # json= bodies set their own Content-Type
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=4),
+    )
 
+@st.cache_resource
+def get_history():
+    """On-disk report history, opened once per server process."""
+    return ReportHistory()
+
+@st.cache_data(ttl=HISTORY_TTL, max_entries=50)
+def load_history(user_key):
+    """(id, timestamp, question) rows of a session's history, newest first - report bodies are read on demand."""
+    return get_history().entries(user_key)
+
+@st.cache_data(ttl=5)
 def check_server():
-    """Simple server health check."""
+    """Simple server health check (cached for a few seconds - every rerun asks)."""
     try:
-        response = requests.get(f"{LANGGRAPH_API_URL}/docs", timeout=5)
+        response = get_client().get("/docs", timeout=5)
         return response.status_code == 200
     except:
         return False
@@ -23,8 +50,7 @@ def check_server():
 def create_thread():
     """Create a new research thread."""
     try:
-        headers = {"Authorization": "Bearer dev-token"}
-        response = requests.post(f"{LANGGRAPH_API_URL}/threads", json={}, headers=headers)
+        response = get_client().post("/threads", json={})
         if response.status_code in [200, 201]:
             result = response.json()
             return result.get("thread_id") or result.get("id")
@@ -32,113 +58,151 @@ def create_thread():
         st.error(f"Failed to create thread: {e}")
     return None
 
+def start_thread():
+    """Create a thread for this browser session, keeping the short ID shown in the UI alongside it."""
+    thread_id = create_thread()
+    st.session_state.thread_id = thread_id
+    st.session_state.thread_id_short = thread_id[:8] if thread_id else None
+    return thread_id
+
+@st.cache_resource(ttl=3600)
 def get_or_create_assistant():
-    """Get or create the Deep Researcher assistant."""
-    try:
-        headers = {"Authorization": "Bearer dev-token"}
-        
-        # First, try to search for existing assistants
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants/search", json={}, headers=headers)
-        if response.status_code == 200:
-            assistants = response.json()
-            if assistants:
-                # Use the first available assistant
-                return assistants[0].get("assistant_id") or assistants[0].get("id")
-        
-        # If no assistants found, create one
-        payload = {
-            "graph_id": "Deep Researcher",
-            "name": "Deep Researcher",
-            "description": "AI research agent"
-        }
-        response = requests.post(f"{LANGGRAPH_API_URL}/assistants", json=payload, headers=headers)
-        if response.status_code in [200, 201]:
-            result = response.json()
-            return result.get("assistant_id") or result.get("id")
-            
-    except Exception as e:
-        st.error(f"Failed to get/create assistant: {e}")
+    """Get or create the Deep Researcher assistant.
+
+    Cached, since the ID doesn't change while the server runs. Failures raise
+    instead of returning None so a missing ID is never cached.
+    """
+    # First, try to search for existing assistants
+    response = get_client().post("/assistants/search", json={})
+    if response.status_code == 200:
+        assistants = response.json()
+        if assistants:
+            # Use the first available assistant
+            return assistants[0].get("assistant_id") or assistants[0].get("id")
     
-    return None
+    # If no assistants found, create one
+    payload = {
+        "graph_id": "Deep Researcher",
+        "name": "Deep Researcher",
+        "description": "AI research agent"
+    }
+    response = get_client().post("/assistants", json=payload)
+    if response.status_code not in [200, 201]:
+        raise RuntimeError(f"Could not create assistant: {response.status_code} - {response.text}")
+    result = response.json()
+    return result.get("assistant_id") or result.get("id")
+
+def iter_sse(response, deadline=None):
+    """Yield (event, data) pairs from a server-sent events response.
 
-def submit_research(thread_id, question):
-    """Submit research query and get the final result."""
+    Lines stay bytes - only event names are decoded, and data is handed
+    straight to orjson, so heartbeats and control lines cost no UTF-8 work.
+    The deadline (a time.monotonic() value) is checked on every line,
+    heartbeats included; TimeoutError is raised once it has passed.
+    """
+    event, data = None, []
+    buffer = b""
+    for chunk in response.iter_bytes():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError
+            line = line.rstrip(b"\r")
+            if not line:
+                if data:
+                    yield event, b"\n".join(data)
+                event, data = None, []
+            elif line.startswith(b"event:"):
+                event = line[6:].strip().decode()
+            elif line.startswith(b"data:"):
+                data.append(line[5:].lstrip())
+
+def submit_research(thread_id, question, placeholder):
+    """Run the research on the run's event stream, rendering output into placeholder as it arrives.
+
+    Returns the final report, or None if the run failed.
+    """
     try:
-        headers = {"Authorization": "Bearer dev-token"}
-        
         # Get assistant ID
-        assistant_id = get_or_create_assistant()
-        if not assistant_id:
-            st.error("Could not get assistant ID")
+        try:
+            assistant_id = get_or_create_assistant()
+        except Exception as e:
+            st.error(f"Could not get assistant ID: {e}")
             return None
         
-        # Submit research (non-streaming first to get run_id)
-        url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs"
+        # Stream state snapshots plus LLM tokens - the server pushes progress instead of us polling for it
+        path = f"/threads/{thread_id}/runs/stream"
         payload = {
             "assistant_id": assistant_id,
-            "input": {"messages": [{"role": "user", "content": question}]}
+            "input": {"messages": [{"role": "user", "content": question}]},
+            "stream_mode": ["values", "messages"],
+            # Keep the run going server-side if we stop reading (timeout, Streamlit rerun)
+            "on_disconnect": "continue"
         }
         
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code != 200:
-            st.error(f"Failed to start research: {response.status_code} - {response.text}")
-            return None
+        deadline = time.monotonic() + MAX_WAIT
+        with get_client().stream("POST", path, json=payload, timeout=httpx.Timeout(MAX_WAIT, connect=5.0)) as response:
+            if response.status_code != 200:
+                response.read()
+                st.error(f"Failed to start research: {response.status_code} - {response.text}")
+                return None
             
-        run_data = response.json()
-        run_id = run_data.get("run_id")
-        
-        if not run_id:
-            st.error("No run ID returned")
-            return None
+            last_values = None
+            for event, data in iter_sse(response, deadline):
+                if event == "messages/partial":
+                    # Each partial carries the message so far - show the latest one
+                    messages = orjson.loads(data)
+                    content = messages[-1].get("content") if messages else None
+                    if content and isinstance(content, str):
+                        placeholder.markdown(content)
+                elif event == "values":
+                    # Each snapshot carries the full state - only the last one needs parsing
+                    last_values = data
+                elif event == "error":
+                    st.error(f"Research run failed: {data.decode(errors='replace')}")
+                    return None
+                elif event == "end":
+                    break
         
-        # Wait for completion and get final state
-        return wait_for_completion(thread_id, run_id, headers)
+        if last_values:
+            return orjson.loads(last_values).get("final_report")
+        return None
         
+    except (TimeoutError, httpx.ReadTimeout):
+        st.error("Research timed out - it is still running on the server")
+        return None
     except Exception as e:
         st.error(f"Request failed: {e}")
         return None
 
-def wait_for_completion(thread_id, run_id, headers):
-    """Wait for the run to complete and get the final state."""
-    import time
+@st.fragment
+def render_history():
+    """Show the session's research history - a fragment, with report bodies only loaded for entries switched on."""
+    history = load_history(st.session_state.history_key)
+    if not history:
+        return
     
-    max_wait = 300  # 5 minutes max
-    wait_time = 0
+    st.header("📚 Research History")
     
-    while wait_time < max_wait:
-        try:
-            # Check run status
-            status_url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/runs/{run_id}"
-            response = requests.get(status_url, headers=headers)
+    for report_id, ts, question in history:
+        timestamp = datetime.fromtimestamp(ts)
+        is_latest = report_id == st.session_state.last_report_id
+        with st.expander(f"🔍 {question[:80]}...", expanded=is_latest):
+            st.markdown(f"**Asked:** {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
+            if not st.toggle("Show report", value=is_latest, key=f"hist_{report_id}"):
+                continue
             
-            if response.status_code == 200:
-                run_info = response.json()
-                status = run_info.get("status")
-                
-                if status == "success":
-                    # Get the final state
-                    state_url = f"{LANGGRAPH_API_URL}/threads/{thread_id}/state"
-                    state_response = requests.get(state_url, headers=headers)
-                    
-                    if state_response.status_code == 200:
-                        state_data = state_response.json()
-                        return state_data.get("values", {}).get("final_report")
-                    
-                elif status == "error":
-                    st.error("Research run failed")
-                    return None
-                    
-            time.sleep(2)
-            wait_time += 2
+            report = get_history().report(report_id)
+            st.markdown("### Report")
+            st.markdown(report)
             
-        except Exception as e:
-            st.error(f"Error checking status: {e}")
-            return None
-    
-    st.error("Research timed out")
-    return None
-
-
+            st.download_button(
+                label="📥 Download",
+                data=report,
+                file_name=f"research_{timestamp.strftime('%Y%m%d_%H%M%S')}.md",
+                mime="text/markdown",
+                key=f"download_history_{report_id}"
+            )
 
 def main():
     st.set_page_config(
@@ -150,8 +214,9 @@ def main():
     st.title("🔍 Open Deep Research V2")
     st.markdown("*Simple AI research agent interface*")
     
-    # Check server
-    if not check_server():
+    # Check server - once per rerun, the status column reuses the result
+    server_ok = check_server()
+    if not server_ok:
         st.error("⚠️ LangGraph server is not running!")
         st.code("uvx --refresh --from \"langgraph-cli[inmem]\" --with-editable . --python 3.11 langgraph dev --allow-blocking --config langgraph.dev.json")
         return
@@ -161,8 +226,11 @@ def main():
     # Initialize session state
     if "thread_id" not in st.session_state:
         st.session_state.thread_id = None
-    if "reports" not in st.session_state:
-        st.session_state.reports = []
+        st.session_state.thread_id_short = None
+    if "history_key" not in st.session_state:
+        # Reports live on disk under this key; session state only remembers the latest one's ID
+        st.session_state.history_key = uuid.uuid4().hex
+        st.session_state.last_report_id = None
     
     # Main interface
     col1, col2 = st.columns([3, 1])
@@ -183,77 +251,65 @@ def main():
                 
             # Create thread if needed
             if not st.session_state.thread_id:
-                st.session_state.thread_id = create_thread()
+                start_thread()
                 
             if not st.session_state.thread_id:
                 st.error("Failed to create research session.")
                 return
             
-            # Submit research
-            with st.spinner("🔍 Researching... This may take a few minutes."):
-                final_report = submit_research(st.session_state.thread_id, question)
+            # Submit research - output streams into the placeholder until the report is ready
+            progress = st.empty()
+            progress.info("🔍 Researching... This may take a few minutes.")
+            final_report = submit_research(st.session_state.thread_id, question, progress)
+            progress.empty()
+            if final_report:
+                st.success("✅ Research completed!")
+                
+                # Display the report
+                st.markdown("### 📄 Research Report")
+                st.markdown(final_report)
+                
+                # Save to history
+                st.session_state.last_report_id = get_history().add(
+                    st.session_state.history_key, question, final_report
+                )
+                load_history.clear()
                 
-                if final_report:
-                    st.success("✅ Research completed!")
-                    
-                    # Display the report
-                    st.markdown("### 📄 Research Report")
-                    st.markdown(final_report)
-                    
-                    # Save to history
-                    st.session_state.reports.append({
-                        "question": question,
-                        "report": final_report,
-                        "timestamp": datetime.now()
-                    })
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 Download Report",
-                        data=final_report,
-                        file_name=f"research_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
-                        mime="text/markdown"
-                    )
-                else:
-                    st.error("❌ No final report was generated. Please try again.")
+                # Download button
+                st.download_button(
+                    label="📥 Download Report",
+                    data=final_report,
+                    file_name=f"research_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                    mime="text/markdown"
+                )
+            else:
+                st.error("❌ No final report was generated. Please try again.")
     
     with col2:
         st.header("Status")
         
-        if check_server():
+        if server_ok:
             st.success("🟢 Server Online")
         else:
             st.error("🔴 Server Offline")
             
         if st.session_state.thread_id:
-            st.info(f"Session: {st.session_state.thread_id[:8]}...")
+            st.info(f"Session: {st.session_state.thread_id_short}...")
             
         if st.button("🔄 New Session"):
-            st.session_state.thread_id = create_thread()
+            # Also forget the cached assistant, in case the server was restarted
+            get_or_create_assistant.clear()
+            start_thread()
             if st.session_state.thread_id:
                 st.success("New session created!")
         
         if st.button("🧹 Clear History"):
-            st.session_state.reports = []
+            get_history().clear(st.session_state.history_key)
+            load_history.clear()
             st.success("History cleared!")
     
     # Research History
-    if st.session_state.reports:
-        st.header("📚 Research History")
-        
-        for i, report in enumerate(reversed(st.session_state.reports)):
-            with st.expander(f"🔍 {report['question'][:80]}...", expanded=(i==0)):
-                st.markdown(f"**Asked:** {report['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
-                st.markdown("### Report")
-                st.markdown(report['report'])
-                
-                st.download_button(
-                    label="📥 Download",
-                    data=report['report'],
-                    file_name=f"research_{report['timestamp'].strftime('%Y%m%d_%H%M%S')}.md",
-                    mime="text/markdown",
-                    key=f"download_history_{i}"
-                )
+    render_history()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file